@@ -1,6 +1,7 @@
 from src import app
+from src.config import MODEL_WARMUP, SENSOR_RUNNER
 from src.controllers.auth_controller import protect
-from src.controllers.sensor_controller import reset
+from src.controllers.sensor_controller import reset, warmup
 
 
 # @app.before_request
@@ -13,8 +14,17 @@ def index():
     return "<p>SGR Sensor</p>"
 
 
-if __name__ == "__main__":
+# Load every sensor's model once at startup, so the first start is fast
+if MODEL_WARMUP:
     with app.app_context():
-        reset()
+        warmup()
+
+
+if __name__ == "__main__":
+    # Embedded pipelines died with the previous process; an external runner's
+    # did not, and it resumes them from Sensor.state
+    if SENSOR_RUNNER == "embedded":
+        with app.app_context():
+            reset()
 
     app.run(host="0.0.0.0", port=5000, debug=True)
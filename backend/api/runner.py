@@ -0,0 +1,20 @@
+import signal
+
+from src import app
+from src.config import MODEL_WARMUP
+from src.controllers.sensor_controller import warmup
+from src.utils.runner import Runner
+
+
+# Standalone owner of all sensor pipelines, for SENSOR_RUNNER=external
+if __name__ == "__main__":
+    if MODEL_WARMUP:
+        with app.app_context():
+            warmup()
+
+    runner = Runner()
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: runner.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: runner.stop())
+
+    runner.run()
@@ -3,7 +3,7 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_mail import Mail
 from flask_cors import CORS
-from sqlalchemy import create_engine
+from sqlalchemy import event
 
 import src.config as config
 
@@ -14,7 +14,24 @@ migrate = Migrate(app, db)
 cors = CORS(app)
 mail = Mail(app)
 
-engine = create_engine(config.SQLALCHEMY_DATABASE_URI)
+# One engine, configured from SQLALCHEMY_DATABASE_URI, shared by the API and
+# by every sensor pipeline
+with app.app_context():
+    engine = db.engine
+
+
+@event.listens_for(engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if engine.dialect.name != "sqlite":
+        return
+
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode={}".format(config.SQLITE_JOURNAL_MODE))
+    cursor.execute("PRAGMA synchronous={}".format(config.SQLITE_SYNCHRONOUS))
+    cursor.execute("PRAGMA mmap_size={}".format(config.SQLITE_MMAP_SIZE))
+    cursor.execute("PRAGMA busy_timeout={}".format(config.SQLITE_BUSY_TIMEOUT))
+    cursor.close()
+
 
 from src.routes.auth_routes import auth_bp
 from src.routes.user_routes import user_bp
@@ -13,7 +13,169 @@ SQLALCHEMY_DATABASE_URI = os.environ.get(
     "SQLALCHEMY_DATABASE_URI", SQLALCHEMY_DATABASE_URI
 )
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+SQLALCHEMY_ENGINE_OPTIONS = {
+    "pool_pre_ping": True,
+}
 
+SQLITE_JOURNAL_MODE = os.environ.get(
+    "SQLITE_JOURNAL_MODE",
+    "WAL",
+)
+SQLITE_SYNCHRONOUS = os.environ.get(
+    "SQLITE_SYNCHRONOUS",
+    "NORMAL",
+)
+SQLITE_MMAP_SIZE = int(
+    os.environ.get(
+        "SQLITE_MMAP_SIZE",
+        2**28,
+    )
+)
+SQLITE_BUSY_TIMEOUT = int(
+    os.environ.get(
+        "SQLITE_BUSY_TIMEOUT",
+        5000,
+    )
+)
+
+# "stream" steps the LSTM once per tick and carries its state; "window" re-runs
+# it over the last `lag` rows, as sensors did before. The carried state
+# remembers past the window, so outputs differ from the window's by up to 2.5%
+# of an output's fitted range over the first `lag` ticks, and by under 0.25%
+# after 2 * lag on the shipped model. Set "window" to keep the previous outputs
+SENSOR_INFERENCE = os.environ.get(
+    "SENSOR_INFERENCE",
+    "stream",
+)
+SENSOR_RUNNER = os.environ.get(
+    "SENSOR_RUNNER",
+    "embedded",
+)
+RUNNER_INTERVAL = float(
+    os.environ.get(
+        "RUNNER_INTERVAL",
+        1.0,
+    )
+)
+# The external runner serves its pipelines' stats here, for the API's
+# metrics endpoints; both run in the same container
+RUNNER_STATS_PORT = int(
+    os.environ.get(
+        "RUNNER_STATS_PORT",
+        5001,
+    )
+)
+RUNNER_STATS_URL = os.environ.get(
+    "RUNNER_STATS_URL",
+    "http://127.0.0.1:{}".format(RUNNER_STATS_PORT),
+)
+SENSOR_EXECUTOR = os.environ.get(
+    "SENSOR_EXECUTOR",
+    "thread",
+)
+SENSOR_RESTART_BACKOFF = float(
+    os.environ.get(
+        "SENSOR_RESTART_BACKOFF",
+        30.0,
+    )
+)
+SENSOR_QUEUE_SIZE = int(
+    os.environ.get(
+        "SENSOR_QUEUE_SIZE",
+        64,
+    )
+)
+SENSOR_QUEUE_POLICY = os.environ.get(
+    "SENSOR_QUEUE_POLICY",
+    "drop",
+)
+SENSOR_WRITE_BATCH = int(
+    os.environ.get(
+        "SENSOR_WRITE_BATCH",
+        64,
+    )
+)
+SENSOR_WRITE_INTERVAL = float(
+    os.environ.get(
+        "SENSOR_WRITE_INTERVAL",
+        1.0,
+    )
+)
+ROLLUP_RETENTION_1M = int(
+    os.environ.get(
+        "ROLLUP_RETENTION_1M",
+        60 * 60 * 24 * 7,
+    )
+)
+ROLLUP_RETENTION_1H = int(
+    os.environ.get(
+        "ROLLUP_RETENTION_1H",
+        60 * 60 * 24 * 365,
+    )
+)
+# Each open stream holds a gunicorn thread for as long as it is connected;
+# keep this below GUNICORN_THREADS so that streams cannot starve the API
+SENSOR_STREAM_LIMIT = int(
+    os.environ.get(
+        "SENSOR_STREAM_LIMIT",
+        16,
+    )
+)
+SENSOR_STREAM_KEEPALIVE = float(
+    os.environ.get(
+        "SENSOR_STREAM_KEEPALIVE",
+        15.0,
+    )
+)
+EXPORT_CHUNK_SIZE = int(
+    os.environ.get(
+        "EXPORT_CHUNK_SIZE",
+        10000,
+    )
+)
+MODEL_CACHE_SIZE = int(
+    os.environ.get(
+        "MODEL_CACHE_SIZE",
+        4,
+    )
+)
+MODEL_WARMUP = bool(
+    int(
+        os.environ.get(
+            "MODEL_WARMUP",
+            0,
+        )
+    )
+)
+MEMORY_RSS_GROWTH = int(
+    os.environ.get(
+        "MEMORY_RSS_GROWTH",
+        2**26,
+    )
+)
+MEMORY_GC_INTERVAL = float(
+    os.environ.get(
+        "MEMORY_GC_INTERVAL",
+        300.0,
+    )
+)
+MEMORY_TRIM_INTERVAL = float(
+    os.environ.get(
+        "MEMORY_TRIM_INTERVAL",
+        60.0,
+    )
+)
+INFERENCE_BATCH_WINDOW = float(
+    os.environ.get(
+        "INFERENCE_BATCH_WINDOW",
+        0.005,
+    )
+)
+
+STORAGE_BACKEND = os.environ.get(
+    "STORAGE_BACKEND",
+    "sqlite",
+)
 
 INFLUXDB_URL = os.environ.get(
     "INFLUXDB_URL",
@@ -23,6 +185,10 @@ INFLUXDB_TOKEN = os.environ.get(
     "INFLUXDB_TOKEN",
     "e0CmbRWan39mFimiuIKZB6gCCKO-uVfIoL9BfxaSXz9P0k72AEn4kbem8rdUfwWYbLLT61kBscIPQiaCj5pxpA==",
 )
+INFLUXDB_ORG = os.environ.get(
+    "INFLUXDB_ORG",
+    "sgr",
+)
 INFLUXDB_BUCKET = os.environ.get(
     "INFLUXDB_BUCKET",
     "stem-sensor",
@@ -1,25 +1,47 @@
-import time
 import threading
-from queue import Queue
+from datetime import datetime
+from queue import Empty
 
-from flask import request, jsonify
+from flask import request, jsonify, Response, stream_with_context
 import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine
+import requests
 
 from src import db
 from src.models.sensor_model import Sensor, SensorSchema
 from src.models.signal_model import Signal, SignalSchema
-
-
-clock_event = threading.Event()
-kill_event = threading.Event()
-
-engine = create_engine("sqlite:///../database/database.db")
+from src.utils.runtime import runtime
+from src.utils.storage import storage, aggregates
+from src.config import (
+    SENSOR_STREAM_KEEPALIVE,
+    SENSOR_STREAM_LIMIT,
+    EXPORT_CHUNK_SIZE,
+    SENSOR_RUNNER,
+)
+from src.utils.channel import EOS
+from src.utils.encoder import get_frame, get_time, respond_frame, event
+from src.utils.export import formats
+from src.utils.inference import warmup as load_model
+from src.utils.metrics import to_prometheus
+from src.utils.registry import registry
+from src.utils.replay import Replay
+from src.utils.runner import get_stats as get_runner_stats
+
+# Open /stream responses, each holding a worker thread while connected
+streams = threading.BoundedSemaphore(SENSOR_STREAM_LIMIT)
+
+
+def validate(fields):
+    # A zero period would stall the clock, a negative one can never tick
+    if "sampling_period" in fields and not float(fields["sampling_period"]) > 0:
+        raise ValueError(
+            "Sampling period must be positive: {}".format(fields["sampling_period"])
+        )
 
 
 def create():
     try:
+        validate(request.json)
         sensor = Sensor(**request.json)
         db.session.add(sensor)
         db.session.commit()
@@ -57,6 +79,7 @@ def update(sensor_id):
     try:
         sensor = Sensor.query.get(sensor_id)
         sensor_schema = SensorSchema()
+        validate(request.json)
         Sensor.query.filter_by(id=sensor_id).update(request.json)
         db.session.commit()
         res = {"status": "success", "data": sensor_schema.dump(sensor)}
@@ -69,8 +92,12 @@ def update(sensor_id):
 def delete(sensor_id):
     try:
         sensor = Sensor.query.get(sensor_id)
+        timeout = sensor.sampling_period + 1
         db.session.delete(sensor)
         db.session.commit()
+        # A running pipeline would keep writing into the dropped tables
+        runtime.stop(sensor_id, timeout=timeout)
+        storage.drop(sensor_id)
         res = {"status": "success", "data": None}
         return jsonify(res), 200
     except Exception as err:
@@ -80,8 +107,14 @@ def delete(sensor_id):
 
 def delete_all():
     try:
+        sensors = Sensor.query.all()
+        sensor_ids = [sensor.id for sensor in sensors]
+        timeout = max([1] + [sensor.sampling_period + 1 for sensor in sensors])
         Sensor.query.delete()
         db.session.commit()
+        runtime.stop_all(timeout=timeout)
+        for sensor_id in sensor_ids:
+            storage.drop(sensor_id)
         res = {"status": "success", "data": None}
         return jsonify(res), 200
     except Exception as err:
@@ -100,54 +133,29 @@ def get_signals(sensor_id):
         return jsonify(res), 404
 
 
+def is_running(sensor):
+    if SENSOR_RUNNER == "embedded":
+        return runtime.is_running(sensor.id)
+
+    return bool(sensor.state)
+
+
 def start(sensor_id):
     try:
         sensor = Sensor.query.get(sensor_id)
-        signals = Signal.query.filter_by(sensor_id=sensor_id).order_by(Signal.id.asc())
+
+        if is_running(sensor):
+            res = {"status": "fail", "message": "Sensor is already running."}
+            return jsonify(res), 400
 
         sensor.state = True
         db.session.commit()
 
         print("Running sensor {}...".format(sensor.id))
 
-        input_queue = Queue()
-        output_queue = Queue()
-
-        clock_thread = threading.Thread(
-            target=sensor.clock,
-            args=(
-                clock_event,
-                kill_event,
-            ),
-        )
-        clock_thread.start()
-
-        receive_thread = threading.Thread(
-            target=sensor.receive,
-            args=(Signal, input_queue, clock_event, kill_event),
-        )
-        receive_thread.start()
-
-        process_thread = threading.Thread(
-            target=sensor.process,
-            args=(Signal, input_queue, output_queue, clock_event, kill_event),
-        )
-        process_thread.start()
-
-        transmit_thread = threading.Thread(
-            target=sensor.transmit,
-            args=(Signal, output_queue, clock_event, kill_event),
-        )
-        transmit_thread.start()
-
-        clean_thread = threading.Thread(
-            target=sensor.clean,
-            args=(
-                clock_event,
-                kill_event,
-            ),
-        )
-        clean_thread.start()
+        # An external runner picks the new state up from the database
+        if SENSOR_RUNNER == "embedded":
+            runtime.start(sensor, Signal)
 
         res = {"status": "success", "data": None}
         return jsonify(res), 202
@@ -163,9 +171,7 @@ def stop(sensor_id):
         sensor.state = False
         db.session.commit()
 
-        kill_event.set()
-        time.sleep(1)
-        kill_event.clear()
+        runtime.stop(sensor_id, timeout=sensor.sampling_period + 1)
 
         res = {"status": "success", "data": None}
         return jsonify(res), 200
@@ -178,13 +184,13 @@ def reset():
     try:
         sensors = Sensor.query.all()
 
+        timeout = 1
         for sensor in sensors:
             sensor.state = False
+            timeout = max(timeout, sensor.sampling_period + 1)
         db.session.commit()
 
-        kill_event.set()
-        time.sleep(1)
-        kill_event.clear()
+        runtime.stop_all(timeout=timeout)
 
         res = {"status": "success", "data": None}
         return jsonify(res), 200
@@ -193,15 +199,37 @@ def reset():
         return jsonify(res), 500
 
 
+def warmup():
+    try:
+        model_paths = {sensor.model_path for sensor in Sensor.query.all()}
+
+        loaded = []
+        for model_path in model_paths:
+            try:
+                load_model(model_path)
+                loaded.append(model_path)
+            except Exception as err:
+                print("Could not warm up {}: {!r}".format(model_path, err))
+
+        res = {"status": "success", "data": loaded}
+        return jsonify(res), 200
+    except Exception as err:
+        res = {"status": "error", "message": repr(err)}
+        return jsonify(res), 500
+
+
 def get_state(sensor_id):
     try:
         sensor = Sensor.query.get(sensor_id)
+        pipeline = runtime.get(sensor_id)
 
         res = {
             "status": "success",
             "data": {
                 "sensor_id": sensor_id,
                 "state": sensor.state,
+                "running": is_running(sensor),
+                "pipeline": pipeline.stats() if pipeline is not None else None,
             },
         }
         return jsonify(res), 200
@@ -210,6 +238,60 @@ def get_state(sensor_id):
         return jsonify(res), 500
 
 
+def get_stats():
+    # In external mode the pipelines live in the runner process
+    if SENSOR_RUNNER == "external":
+        return get_runner_stats()
+
+    return runtime.stats()
+
+
+def get_metrics(sensor_id):
+    try:
+        if SENSOR_RUNNER == "external":
+            stats = get_runner_stats().get(sensor_id)
+        else:
+            pipeline = runtime.get(sensor_id)
+            alive = pipeline is not None and pipeline.is_alive()
+            stats = pipeline.stats() if alive else None
+
+        if stats is None:
+            res = {
+                "status": "fail",
+                "message": "Sensor is not running.",
+            }
+            return jsonify(res), 400
+
+        res = {
+            "status": "success",
+            "data": {
+                "sensor_id": sensor_id,
+                **stats,
+            },
+        }
+        return jsonify(res), 200
+    except requests.RequestException:
+        res = {"status": "error", "message": "Sensor runner is not reachable."}
+        return jsonify(res), 503
+    except Exception as err:
+        res = {"status": "error", "message": repr(err)}
+        return jsonify(res), 500
+
+
+def prometheus():
+    try:
+        return Response(
+            to_prometheus(get_stats()),
+            mimetype="text/plain; version=0.0.4",
+        )
+    except requests.RequestException:
+        res = {"status": "error", "message": "Sensor runner is not reachable."}
+        return jsonify(res), 503
+    except Exception as err:
+        res = {"status": "error", "message": repr(err)}
+        return jsonify(res), 500
+
+
 def set_state(sensor_id, state):
     try:
         sensor = Sensor.query.get(sensor_id)
@@ -241,6 +323,9 @@ def set_values(sensor_id):
 
         db.session.commit()
 
+        for signal in signals:
+            runtime.set_setpoint(sensor_id, signal.id, signal.setpoint)
+
         res = {"status": "success", "data": signals_schema.dump(signals)}
         return jsonify(res), 200
     except Exception as err:
@@ -248,10 +333,25 @@ def set_values(sensor_id):
         return jsonify(res), 500
 
 
+def get_cursor(value):
+    # Accepts the `cursor` returned by a previous response (ISO 8601)
+    return datetime.fromisoformat(
+        value.translate(str.maketrans({"T": " ", "Z": " "})).strip()
+    )
+
+
+def get_since():
+    since = request.args.get("since")
+
+    return None if since is None else get_cursor(since)
+
+
 def get_data(sensor_id, start_date, end_date):
     try:
         sensor = Sensor.query.get(sensor_id)
-        signals = Signal.query.filter_by(sensor_id=sensor_id).order_by(Signal.id.asc())
+        signals = (
+            Signal.query.filter_by(sensor_id=sensor_id).order_by(Signal.id.asc()).all()
+        )
 
         x_columns = []
         y_columns = []
@@ -262,52 +362,52 @@ def get_data(sensor_id, start_date, end_date):
             elif signal.group == "output":
                 y_columns.append(column)
 
-        query = """SELECT * FROM data WHERE date_time BETWEEN ? AND ? ORDER BY date_time ASC"""
-
         start_date = start_date.translate(str.maketrans({"T": " ", "Z": " "}))
         end_date = end_date.translate(str.maketrans({"T": " ", "Z": " "}))
 
-        result = pd.read_sql(
-            query,
-            con=engine,
-            params=(start_date, end_date),
-            parse_dates=["date_time"],
-            index_col="date_time",
+        try:
+            since = get_since()
+        except ValueError:
+            res = {
+                "status": "fail",
+                "message": "Invalid since cursor: {}.".format(request.args["since"]),
+            }
+            return jsonify(res), 400
+        max_points = request.args.get("max_points", type=int)
+        aggregate = request.args.get("aggregate", "mean")
+        if aggregate not in aggregates:
+            res = {
+                "status": "fail",
+                "message": "Aggregate must be one of: {}.".format(
+                    ", ".join(aggregates)
+                ),
+            }
+            return jsonify(res), 400
+
+        result = storage.read_range(
+            sensor_id,
+            x_columns + y_columns,
+            start_date,
+            end_date,
+            max_points=max_points,
+            aggregate=aggregate,
+            since=since,
         )
 
         if not result.empty:
-            date_time = (
-                pd.to_datetime(result.index.values)
-                .strftime("%Y-%m-%d %H:%M:%S")
-                .tolist()
+            times, values = get_frame(result, signals)
+            return respond_frame(
+                times,
+                values,
+                signals,
+                [signal.name for signal in signals],
+                sep=" ",
             )
-
-            values = []
-            for signal in signals:
-                column = "signal_{}".format(signal.id)
-                values.append(
-                    {
-                        "id": signal.id,
-                        "name": signal.name,
-                        "description": signal.description,
-                        "value": np.around(
-                            result[column].values,
-                            decimals=3,
-                        ).tolist(),
-                    }
-                )
-
-                res = {
-                    "status": "success",
-                    "data": {
-                        "date_time": date_time,
-                        "values": values,
-                    },
-                }
         else:
             res = {
                 "status": "success",
                 "data": None,
+                "cursor": request.args.get("since"),
             }
 
         return jsonify(res), 200
@@ -316,63 +416,264 @@ def get_data(sensor_id, start_date, end_date):
         return jsonify(res), 404
 
 
-def get_points(sensor_id):
+def export(sensor_id, start_date, end_date):
+    try:
+        signals = (
+            Signal.query.filter_by(sensor_id=sensor_id).order_by(Signal.id.asc()).all()
+        )
+
+        x_signals = [signal for signal in signals if signal.group == "input"]
+        y_signals = [signal for signal in signals if signal.group == "output"]
+        signals = x_signals + y_signals
+        columns = ["signal_{}".format(signal.id) for signal in signals]
+
+        start_date = start_date.translate(str.maketrans({"T": " ", "Z": " "}))
+        end_date = end_date.translate(str.maketrans({"T": " ", "Z": " "}))
+
+        format = request.args.get("format", "csv")
+        if format not in formats:
+            res = {
+                "status": "fail",
+                "message": "Format must be one of: {}.".format(", ".join(formats)),
+            }
+            return jsonify(res), 400
+        mimetype, encode = formats[format]
+
+        chunksize = request.args.get("chunksize", EXPORT_CHUNK_SIZE, type=int)
+        frames = storage.export(sensor_id, columns, start_date, end_date, chunksize)
+
+        filename = "sensor_{}.{}".format(sensor_id, format)
+        headers = {
+            "Content-Disposition": "attachment; filename={}".format(filename),
+            "X-Accel-Buffering": "no",
+        }
+        return Response(
+            stream_with_context(encode(frames, columns, signals)),
+            mimetype=mimetype,
+            headers=headers,
+        )
+    except Exception as err:
+        res = {"status": "fail", "message": repr(err)}
+        return jsonify(res), 404
+
+
+def replay(sensor_id):
     try:
         sensor = Sensor.query.get(sensor_id)
-        signals = Signal.query.filter_by(sensor_id=sensor_id).order_by(Signal.id.asc())
+        signals = (
+            Signal.query.filter_by(sensor_id=sensor_id).order_by(Signal.id.asc()).all()
+        )
 
-        x_columns = []
-        y_columns = []
-        for signal in signals:
-            column = "signal_{}".format(signal.id)
-            if signal.group == "input":
-                x_columns.append(column)
-            elif signal.group == "output":
-                y_columns.append(column)
+        x_signals = [signal for signal in signals if signal.group == "input"]
+        y_signals = [signal for signal in signals if signal.group == "output"]
+        x_columns = ["signal_{}".format(signal.id) for signal in x_signals]
+        y_columns = ["signal_{}".format(signal.id) for signal in y_signals]
 
-        query = """SELECT * FROM (SELECT * FROM data ORDER BY date_time DESC LIMIT ?) AS recent_records ORDER BY date_time ASC;"""
+        body = request.json
+        write = bool(body.get("write", False))
 
-        limit = request.args.get("limit")
+        if "values" in body:
+            # Same columnar shape as the get_data and get_points responses
+            inputs = {value["id"]: value["value"] for value in body["values"]}
+            missing = [signal.name for signal in x_signals if signal.id not in inputs]
+            if len(missing) > 0:
+                res = {
+                    "status": "fail",
+                    "message": "Missing input signals: {}.".format(", ".join(missing)),
+                }
+                return jsonify(res), 400
+
+            times = pd.to_datetime(body["date_time"]).values
+            x = np.column_stack(
+                [
+                    np.asarray(inputs[signal.id], dtype=np.float64)
+                    for signal in x_signals
+                ]
+            )
+        else:
+            if write:
+                res = {
+                    "status": "fail",
+                    "message": "Stored ranges are replayed read-only.",
+                }
+                return jsonify(res), 400
 
-        result = pd.read_sql(
-            query,
-            con=engine,
-            params=(limit,),
-            parse_dates=["date_time"],
-            index_col="date_time",
+            start_date = body["start_date"].translate(
+                str.maketrans({"T": " ", "Z": " "})
+            )
+            end_date = body["end_date"].translate(str.maketrans({"T": " ", "Z": " "}))
+            result = storage.read_range(sensor_id, x_columns, start_date, end_date)
+            times = result.index.values
+            x = result[x_columns].to_numpy(dtype=np.float64)
+
+        if len(times) == 0:
+            res = {"status": "success", "data": None}
+            return jsonify(res), 200
+
+        key, repeater = registry.acquire(sensor.model_path)
+        try:
+            y = Replay(repeater).run(x)
+        finally:
+            registry.release(key)
+
+        values = np.concatenate((x, y), axis=1)
+
+        if write:
+            writer = storage.writer(
+                sensor_id,
+                x_columns + y_columns,
+                sensor.buffer * sensor.sampling_period,
+                batch_size=EXPORT_CHUNK_SIZE,
+            )
+            writer.replace(pd.DatetimeIndex(times).to_pydatetime(), values)
+
+        return respond_frame(
+            times,
+            values,
+            x_signals + y_signals,
+            [signal.name for signal in x_signals + y_signals],
+            sep=" ",
         )
+    except ValueError as err:
+        # Includes ranges whose rollups can no longer be rebuilt
+        res = {"status": "fail", "message": repr(err)}
+        return jsonify(res), 400
+    except Exception as err:
+        res = {"status": "error", "message": repr(err)}
+        return jsonify(res), 500
 
-        if not result.empty:
-            values = []
+
+def get_points(sensor_id):
+    try:
+        limit = request.args.get("limit", type=int)
+        try:
+            since = get_since()
+        except ValueError:
+            res = {
+                "status": "fail",
+                "message": "Invalid since cursor: {}.".format(request.args["since"]),
+            }
+            return jsonify(res), 400
+
+        pipeline = runtime.get(sensor_id)
+        if pipeline is not None and pipeline.is_alive() and len(pipeline.history) > 0:
+            # Served straight from the transmit stage's ring, no database hit
+            signals = pipeline.signals
+            times, values = pipeline.history.latest(
+                limit, ["signal_{}".format(signal.id) for signal in signals], since
+            )
+        else:
+            signals = (
+                Signal.query.filter_by(sensor_id=sensor_id)
+                .order_by(Signal.id.asc())
+                .all()
+            )
+            x_columns = []
+            y_columns = []
             for signal in signals:
                 column = "signal_{}".format(signal.id)
-                values.append(
-                    {
-                        "id": signal.id,
-                        "name": "{} [{}]".format(signal.name, signal.unit),
-                        "description": signal.description,
-                        "records": np.column_stack(
-                            [
-                                pd.to_datetime(result.index.values).strftime(
-                                    "%Y-%m-%dT%H:%M:%S"
-                                ),
-                                np.around(result[column], decimals=3),
-                            ]
-                        ).tolist(),
-                    }
-                )
+                if signal.group == "input":
+                    x_columns.append(column)
+                elif signal.group == "output":
+                    y_columns.append(column)
 
-                res = {
-                    "status": "success",
-                    "data": values,
-                }
+            result = storage.read_latest(sensor_id, x_columns + y_columns, limit, since)
+            times, values = get_frame(result, signals)
+
+        labels = ["{} [{}]".format(signal.name, signal.unit) for signal in signals]
+
+        if len(times) > 0:
+            return respond_frame(times, values, signals, labels)
         else:
             res = {
                 "status": "success",
                 "data": None,
+                "cursor": request.args.get("since"),
             }
 
         return jsonify(res), 200
     except Exception as err:
         res = {"status": "fail", "message": repr(err)}
         return jsonify(res), 404
+
+
+def stream(sensor_id):
+    try:
+        sensor = Sensor.query.get(sensor_id)
+        signals = (
+            Signal.query.filter_by(sensor_id=sensor_id).order_by(Signal.id.asc()).all()
+        )
+
+        x_signals = [signal for signal in signals if signal.group == "input"]
+        y_signals = [signal for signal in signals if signal.group == "output"]
+        meta = [
+            {
+                "id": signal.id,
+                "name": "{} [{}]".format(signal.name, signal.unit),
+                "description": signal.description,
+            }
+            for signal in x_signals + y_signals
+        ]
+
+        channel = runtime.subscribe(sensor_id)
+        if channel is None and SENSOR_RUNNER == "external" and sensor.state:
+            # The pipeline lives in the runner process; tail its writes instead
+            channel = runtime.follow(
+                sensor,
+                ["signal_{}".format(signal.id) for signal in x_signals + y_signals],
+            )
+        if channel is None:
+            res = {
+                "status": "fail",
+                "message": "Sensor is not running.",
+            }
+            return jsonify(res), 400
+
+        if not streams.acquire(blocking=False):
+            runtime.unsubscribe(sensor_id, channel)
+            res = {
+                "status": "fail",
+                "message": "Too many open streams, poll /points instead.",
+            }
+            return jsonify(res), 503
+
+        def generate():
+            yield event(meta, "signals")
+            while True:
+                try:
+                    record = channel.get(timeout=SENSOR_STREAM_KEEPALIVE)
+                except Empty:
+                    yield b": keepalive\n\n"
+                    continue
+                if record is EOS:
+                    yield event(None, "end")
+                    break
+
+                date_time, values = record
+                yield event(
+                    {
+                        "date_time": get_time(date_time),
+                        "value": values.round(3),
+                    }
+                )
+
+        headers = {
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+        response = Response(
+            stream_with_context(generate()),
+            mimetype="text/event-stream",
+            headers=headers,
+        )
+
+        def close():
+            runtime.unsubscribe(sensor_id, channel)
+            streams.release()
+
+        # Runs even when the client leaves before the first event
+        response.call_on_close(close)
+        return response
+    except Exception as err:
+        res = {"status": "error", "message": repr(err)}
+        return jsonify(res), 500
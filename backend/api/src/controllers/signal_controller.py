@@ -1,6 +1,7 @@
 from flask import request, jsonify
 from src import db
 from src.models.signal_model import Signal, SignalSchema
+from src.utils.runtime import runtime
 
 
 def create():
@@ -45,6 +46,7 @@ def update(signal_id):
         signal_schema = SignalSchema()
         Signal.query.filter_by(id=signal_id).update(request.json)
         db.session.commit()
+        runtime.set_setpoint(signal.sensor_id, signal.id, signal.setpoint)
         res = {"status": "success", "data": signal_schema.dump(signal)}
         return jsonify(res), 200
     except Exception as err:
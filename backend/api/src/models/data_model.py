@@ -0,0 +1,94 @@
+from sqlalchemy import (
+    MetaData,
+    Table,
+    Column,
+    DateTime,
+    Float,
+    Integer,
+    Index,
+    inspect,
+    text,
+)
+
+
+# Rollup resolutions kept alongside the raw samples, in seconds
+resolutions = {"1m": 60, "1h": 3600}
+
+
+def get_table_name(sensor_id, resolution=None):
+    if resolution is None:
+        return "data_{}".format(sensor_id)
+
+    return "data_{}_{}".format(sensor_id, resolution)
+
+
+def get_table(sensor_id, columns):
+    name = get_table_name(sensor_id)
+    table = Table(
+        name,
+        MetaData(),
+        Column("date_time", DateTime, nullable=False),
+        *[Column(column, Float) for column in columns],
+    )
+    Index("ix_{}_date_time".format(name), table.c.date_time)
+
+    return table
+
+
+def get_rollup_table(sensor_id, resolution, columns):
+    return Table(
+        get_table_name(sensor_id, resolution),
+        MetaData(),
+        Column("bucket", DateTime, primary_key=True),
+        Column("count", Integer, nullable=False),
+        *[
+            Column("{}_{}".format(column, aggregate), Float)
+            for column in columns
+            for aggregate in ("sum", "min", "max")
+        ],
+    )
+
+
+def ensure_table(engine, table):
+    table.create(engine, checkfirst=True)
+
+    # Signals added after the table was created become new nullable columns
+    existing = {column["name"] for column in inspect(engine).get_columns(table.name)}
+    with engine.begin() as conn:
+        for column in table.columns:
+            if column.name not in existing:
+                conn.execute(
+                    text(
+                        "ALTER TABLE {} ADD COLUMN {} {}".format(
+                            table.name,
+                            column.name,
+                            column.type.compile(engine.dialect),
+                        )
+                    )
+                )
+
+    return table
+
+
+def create_table(engine, sensor_id, columns):
+    for resolution in resolutions:
+        ensure_table(engine, get_rollup_table(sensor_id, resolution, columns))
+
+    return ensure_table(engine, get_table(sensor_id, columns))
+
+
+def has_table(engine, sensor_id, resolution=None):
+    return inspect(engine).has_table(get_table_name(sensor_id, resolution))
+
+
+def drop_table(engine, sensor_id):
+    with engine.begin() as conn:
+        for resolution in resolutions:
+            conn.execute(
+                text(
+                    "DROP TABLE IF EXISTS {}".format(
+                        get_table_name(sensor_id, resolution)
+                    )
+                )
+            )
+        conn.execute(text("DROP TABLE IF EXISTS {}".format(get_table_name(sensor_id))))
@@ -1,17 +1,20 @@
+import time
 import uuid
 from datetime import datetime
-import time
-import gc
-import ctypes
+from queue import Empty
 
 from flask_marshmallow import Marshmallow
 import numpy as np
-import pandas as pd
-from sklearn.preprocessing import MinMaxScaler
 import torch
-from sqlalchemy import create_engine, text
 
-from src import app, db, engine
+from src import app, db
+from src.config import SENSOR_INFERENCE
+from src.utils.buffer import Window
+from src.utils.channel import EOS
+from src.utils.inference import schedulers, step
+from src.utils.memory import memory
+from src.utils.scaler import Scaler
+from src.utils.storage import storage
 
 
 ma = Marshmallow()
@@ -24,7 +27,7 @@ class Sensor(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     description = db.Column(db.String)
-    sampling_period = db.Column(db.Integer, default=1)
+    sampling_period = db.Column(db.Float, default=1)
     input_size = db.Column(db.Integer)
     output_size = db.Column(db.Integer)
     buffer = db.Column(db.Integer)
@@ -67,168 +70,152 @@ class Sensor(db.Model):
 
         return columns, x_columns, y_columns
 
-    def clock(self, clock_event, kill_event):
-        while True:
-            clock_event.set()
-            clock_event.clear()
-            time.sleep(self.sampling_period)
-
-            if kill_event.is_set():
-                clock_event.set()
-                clock_event.clear()
-                break
-
-    def receive(self, Signal, input_queue, clock_event, kill_event):
-
-        with app.app_context():
-            signals = Signal.query.filter_by(sensor_id=self.id).order_by(
-                Signal.id.asc()
-            )
-            _, x_columns, _ = self.get_fields(signals)
-
-        while True:
-            clock_event.wait()
+    def clock(self, clock, kill_event):
+        clock.run(kill_event)
 
-            data = [datetime.now().isoformat()]
-            with app.app_context():
-                for signal in signals:
-                    if signal.group == "input":
-                        data.append(signal.setpoint)
-
-            df_input = (
-                pd.DataFrame(
-                    [data],
-                    columns=["date_time"] + x_columns,
-                )
-                .set_index("date_time")
-                .astype("float")
-            )
-
-            input_queue.put(df_input)
-
-            if kill_event.is_set():
-                break
+    def receive(self, setpoints, input_queue, clock, metrics):
+        try:
+            tick = None
+            while True:
+                tick = clock.wait(tick, "receive")
+                if tick is None:
+                    break
 
-    def process(self, Signal, input_queue, output_queue, clock_event, kill_event):
-        repeater = torch.jit.load(self.model_path).to(device)
+                start = time.perf_counter()
+                record = (datetime.now(), setpoints.get())
+                metrics.observe("receive", time.perf_counter() - start)
 
-        with app.app_context():
-            signals = Signal.query.filter_by(sensor_id=self.id).order_by(
-                Signal.id.asc()
-            )
-            columns, x_columns, _ = self.get_fields(signals)
-
-        feature_range = (-1, 1)
-
-        x_scaler = MinMaxScaler(feature_range=feature_range)
-        x_scaler.min_ = repeater.x_min_
-        x_scaler.scale_ = repeater.x_scale_
-        x_scaler.data_min_ = repeater.x_data_min_
-        x_scaler.data_max_ = repeater.x_data_max_
-        x_scaler.data_range_ = repeater.x_data_range_
-        x_scaler.n_features_in_ = repeater.x_n_features_in_
-        x_scaler.n_samples_seen_ = repeater.x_n_samples_seen_
-
-        y_scaler = MinMaxScaler(feature_range=feature_range)
-        y_scaler.min_ = repeater.y_min_
-        y_scaler.scale_ = repeater.y_scale_
-        y_scaler.data_min_ = repeater.y_data_min_
-        y_scaler.data_max_ = repeater.y_data_max_
-        y_scaler.data_range_ = repeater.y_data_range_
-        y_scaler.n_features_in_ = repeater.y_n_features_in_
-        y_scaler.n_samples_seen_ = repeater.y_n_samples_seen_
-
-        x = pd.DataFrame(
-            data=np.full((repeater.lag, self.input_size), 0), columns=x_columns
-        )
-        y_scaled = torch.FloatTensor(
-            np.expand_dims(np.zeros((repeater.lag, self.output_size)), axis=0)
-        )
+                if not input_queue.put(record):
+                    break
+        finally:
+            input_queue.close()
+
+    def process(self, input_queue, output_queue, metrics):
+        scheduler = None
+        try:
+            # Sensors sharing a model file share one copy and one batched forward
+            scheduler = schedulers.acquire(self.model_path, self.sampling_period)
+            self.infer(scheduler, input_queue, output_queue, metrics)
+        finally:
+            # Closed even when the model fails to load, so the neighbouring
+            # stages end instead of blocking on a channel nobody feeds
+            if scheduler is not None:
+                schedulers.release(scheduler, self.sampling_period)
+            input_queue.close()
+            output_queue.close()
+
+    def infer(self, scheduler, input_queue, output_queue, metrics):
+        forward = metrics.histograms["forward"]
+        repeater = scheduler.model
+        x_scaler = Scaler.from_model(repeater, "x_")
+        # Outputs are unscaled in double precision, as sklearn did
+        y_scaler = Scaler.from_model(repeater, "y_", np.float64)
+
+        # Windows hold scaled rows, primed with an all-zero input history
+        x_window = Window(repeater.lag, self.input_size, fill=x_scaler.min)
+        y_window = Window(repeater.lag, self.output_size)
 
         with torch.inference_mode():
+            if SENSOR_INFERENCE == "stream":
+                # Warm-start the LSTM state on the initial window, as the
+                # windowed forward would see it on the first sample
+                h = torch.zeros(repeater.num_layers, 1, repeater.hidden_size).to(device)
+                c = torch.zeros(repeater.num_layers, 1, repeater.hidden_size).to(device)
+                x_scaled = torch.from_numpy(x_window.view()[1:]).unsqueeze(0)
+                y_scaled = torch.from_numpy(y_window.view()[1:]).unsqueeze(0)
+                _, h, c = step(repeater, x_scaled.to(device), y_scaled.to(device), h, c)
+
             while True:
-                clock_event.wait()
-                if len(input_queue.queue) > 0:
-                    x_data = input_queue.get()
-                    x = pd.concat([x, x_data[x_columns]], join="outer", axis=0).iloc[
-                        -repeater.lag :, :
-                    ]
-                    x_scaled = x_scaler.transform(x.to_numpy())
-                    x_scaled = torch.FloatTensor(np.expand_dims(x_scaled, axis=0))
-                    z = repeater.forward(x_scaled, y_scaled)
-                    y_scaled = torch.cat(
-                        (y_scaled, torch.unsqueeze(z[:, -1, :], dim=0)), dim=1
-                    )[:, -repeater.lag :, :]
-                    y = y_scaler.inverse_transform(
-                        np.squeeze(y_scaled.cpu().detach().numpy(), axis=0)
-                    )
+                record = input_queue.get()
+                if record is EOS:
+                    break
 
-                    df_output = pd.DataFrame(
-                        np.hstack(
-                            (
-                                x_data.values[-1:, :],
-                                y[-1:, :],
-                            )
-                        ),
-                        columns=columns,
+                start = time.perf_counter()
+                date_time, x = record
+                x_window.push(x_scaler.transform(x))
+
+                if SENSOR_INFERENCE == "stream":
+                    x_scaled = torch.from_numpy(x_window.view()[-1:]).unsqueeze(0)
+                    y_scaled = torch.from_numpy(y_window.view()[-1:]).unsqueeze(0)
+                    submitted = time.perf_counter()
+                    z, h, c = scheduler.submit(
+                        "step",
+                        x_scaled.to(device),
+                        y_scaled.to(device),
+                        h,
+                        c,
+                        period=self.sampling_period,
+                        histogram=forward,
+                    )
+                else:
+                    x_scaled = torch.from_numpy(x_window.view()).unsqueeze(0)
+                    y_scaled = torch.from_numpy(y_window.view()).unsqueeze(0)
+                    submitted = time.perf_counter()
+                    z = scheduler.submit(
+                        "forward",
+                        x_scaled.to(device),
+                        y_scaled.to(device),
+                        period=self.sampling_period,
+                        histogram=forward,
                     )
-                    df_output.index = pd.to_datetime(x_data.index)
-                    output_queue.put(df_output)
+                # Includes the batching window on top of the forward itself
+                metrics.observe("inference", time.perf_counter() - submitted)
 
-                if kill_event.is_set():
+                z = z[0, -1:, :].cpu().numpy()
+                y_window.push(z[-1])
+                y = y_scaler.inverse_transform(z)
+                record = (date_time, np.concatenate((x, y[-1])))
+                metrics.observe("process", time.perf_counter() - start)
+
+                if not output_queue.put(record):
                     break
 
-    def transmit(self, Signal, output_queue, clock_event, kill_event):
-        engine = create_engine("sqlite:///../database/database.db")
-        table = "data"
+    def transmit(self, Signal, output_queue, history, broadcaster, metrics):
+        writer = None
+        try:
+            with app.app_context():
+                signals = Signal.query.filter_by(sensor_id=self.id).order_by(
+                    Signal.id.asc()
+                )
+                columns, _, _ = self.get_fields(signals)
 
-        with app.app_context():
-            signals = Signal.query.filter_by(sensor_id=self.id).order_by(
-                Signal.id.asc()
+            writer = storage.writer(
+                self.id, columns, self.buffer * self.sampling_period
             )
-            columns, _, _ = self.get_fields(signals)
-
-        df_data = pd.DataFrame(
-            data=np.full((self.buffer, len(columns)), 0), columns=columns
-        )
-        df_data.index = pd.date_range(
-            end=pd.to_datetime("now"), periods=self.buffer, freq="1s"
-        )
-        df_data.index.name = "date_time"
-        df_data.to_sql(
-            table, con=engine, if_exists="replace", index=True, index_label="date_time"
-        )
-
-        while True:
-            clock_event.wait()
-            if len(output_queue.queue) > 0:
-                df_output = output_queue.get()
-                df_output.to_sql(table, con=engine, if_exists="append", index=True)
-
-                query = text(
-                    f"""DELETE FROM {table} WHERE rowid NOT IN (SELECT rowid FROM {table} ORDER BY date_time DESC LIMIT :limit)"""
-                )
-                with engine.begin() as conn:
-                    conn.execute(query, {"limit": self.buffer})
 
-            if kill_event.is_set():
-                break
+            while True:
+                try:
+                    record = output_queue.get(timeout=writer.timeout())
+                except Empty:
+                    start = time.perf_counter()
+                    writer.flush()
+                    metrics.observe("transmit", time.perf_counter() - start)
+                    continue
+                if record is EOS:
+                    break
 
-    def clean(self, clock_event, kill_event):
+                start = time.perf_counter()
+                writer.write(*record)
+                history.push(*record)
+                broadcaster.publish(record)
+                metrics.observe("transmit", time.perf_counter() - start)
+                # From the tick's timestamp until the sample is out of the pipeline
+                metrics.observe("latency", (datetime.now() - record[0]).total_seconds())
+        finally:
+            if writer is not None:
+                writer.flush()
+            output_queue.close()
+            broadcaster.close()
+
+    def clean(self, clock):
+        tick = None
         while True:
-            clock_event.wait()
-            gc.collect()
-
-            try:
-                ctypes.CDLL("libc.so.6").malloc_trim(0)
-            except:
-                pass
-
-            if kill_event.is_set():
-                clock_event.set()
-                clock_event.clear()
+            tick = clock.wait(tick, "clean")
+            if tick is None:
                 break
 
+            memory.check()
+
 
 class SensorSchema(ma.SQLAlchemySchema):
     class Meta:
@@ -11,10 +11,15 @@ from src.controllers.sensor_controller import (
     stop,
     reset,
     get_state,
+    get_metrics,
+    prometheus,
     set_state,
     set_values,
     get_data,
     get_points,
+    export,
+    replay,
+    stream,
 )
 
 sensor_bp = Blueprint("sensor_bp", __name__, url_prefix="/api/sensor")
@@ -30,9 +35,16 @@ sensor_bp.route("/<int:sensor_id>/start", methods=["GET"])(start)
 sensor_bp.route("/<int:sensor_id>/stop", methods=["GET"])(stop)
 sensor_bp.route("/reset", methods=["GET"])(reset)
 sensor_bp.route("/<int:sensor_id>/state", methods=["GET"])(get_state)
+sensor_bp.route("/<int:sensor_id>/metrics", methods=["GET"])(get_metrics)
+sensor_bp.route("/metrics", methods=["GET"])(prometheus)
 sensor_bp.route("/<int:sensor_id>/state/<int:state>", methods=["GET"])(set_state)
 sensor_bp.route("/<int:sensor_id>/values", methods=["POST"])(set_values)
 sensor_bp.route("<int:sensor_id>/data/<start_date>/<end_date>", methods=["GET"])(
     get_data
 )
+sensor_bp.route("/<int:sensor_id>/export/<start_date>/<end_date>", methods=["GET"])(
+    export
+)
+sensor_bp.route("/<int:sensor_id>/replay", methods=["POST"])(replay)
 sensor_bp.route("/<int:sensor_id>/points", methods=["GET"])(get_points)
+sensor_bp.route("/<int:sensor_id>/stream", methods=["GET"])(stream)
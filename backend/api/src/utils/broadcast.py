@@ -0,0 +1,46 @@
+import threading
+
+from src.utils.channel import Channel
+
+
+class Broadcaster:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    def subscribe(self):
+        # Slow clients lose their oldest samples instead of stalling transmit
+        channel = Channel(self.maxsize, "drop")
+        with self.lock:
+            if self.closed:
+                channel.close()
+            else:
+                self.subscribers.add(channel)
+
+        return channel
+
+    def unsubscribe(self, channel):
+        with self.lock:
+            self.subscribers.discard(channel)
+        channel.close()
+
+    def publish(self, item):
+        with self.lock:
+            subscribers = list(self.subscribers)
+
+        for channel in subscribers:
+            channel.put(item)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            subscribers = list(self.subscribers)
+            self.subscribers.clear()
+
+        for channel in subscribers:
+            channel.close()
@@ -0,0 +1,69 @@
+import threading
+
+import numpy as np
+
+
+class Window:
+    def __init__(self, size, width, fill=0, dtype=np.float32):
+        self.size = size
+        self.width = width
+        # Every row is written twice, so the last `size` rows are always a
+        # contiguous slice and `view` never has to copy or reorder
+        self.data = np.empty((2 * size, width), dtype=dtype)
+        self.data[:] = fill
+        self.index = 0
+
+    def push(self, row):
+        self.data[self.index] = row
+        self.data[self.index + self.size] = row
+        self.index = (self.index + 1) % self.size
+
+    def view(self):
+        return self.data[self.index : self.index + self.size]
+
+    def last(self):
+        return self.data[self.index + self.size - 1]
+
+
+class History:
+    def __init__(self, size, columns):
+        self.size = size
+        self.columns = columns
+        self.times = Window(size, 1, fill=np.datetime64("NaT"), dtype="datetime64[us]")
+        self.values = Window(size, len(columns), fill=np.nan, dtype=np.float64)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def push(self, date_time, values):
+        with self.lock:
+            self.times.push(np.datetime64(date_time, "us"))
+            self.values.push(values)
+            self.count += 1
+
+    def latest(self, limit=None, columns=None, since=None):
+        with self.lock:
+            n = len(self)
+            start = self.size - n
+            stop = self.size
+            if since is not None:
+                # Times are ascending, so newer rows are a suffix of the ring;
+                # a cursor pages forward through it, oldest rows first
+                times = self.times.view()[start:, 0]
+                start += np.searchsorted(
+                    times, np.datetime64(since, "us"), side="right"
+                )
+                if limit is not None:
+                    stop = min(stop, start + limit)
+            elif limit is not None:
+                start = max(start, stop - limit)
+            times = self.times.view()[start:stop, 0].copy()
+            values = self.values.view()[start:stop]
+            if columns is not None:
+                values = values[:, [self.columns.index(column) for column in columns]]
+            else:
+                values = values.copy()
+
+        return times, values
@@ -0,0 +1,61 @@
+import threading
+from collections import deque
+from queue import Empty
+
+
+# Returned by `Channel.get` once the channel is closed and drained
+EOS = None
+
+
+class Channel:
+    def __init__(self, maxsize, policy="drop"):
+        if policy not in ("drop", "block"):
+            raise ValueError("Unknown queue policy: {}".format(policy))
+
+        self.maxsize = maxsize
+        self.policy = policy
+        self.items = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, item):
+        with self.condition:
+            if self.policy == "block":
+                self.condition.wait_for(
+                    lambda: self.closed or len(self.items) < self.maxsize
+                )
+            if self.closed:
+                return False
+
+            if len(self.items) >= self.maxsize:
+                # Drop-oldest: the freshest sample is the one worth keeping
+                self.items.popleft()
+                self.dropped += 1
+
+            self.items.append(item)
+            self.condition.notify_all()
+
+        return True
+
+    def get(self, timeout=None):
+        with self.condition:
+            if not self.condition.wait_for(
+                lambda: self.closed or len(self.items) > 0, timeout
+            ):
+                raise Empty
+            if len(self.items) == 0:
+                return EOS
+
+            item = self.items.popleft()
+            self.condition.notify_all()
+
+        return item
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
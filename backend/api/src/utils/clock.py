@@ -0,0 +1,85 @@
+import math
+import time
+import threading
+
+
+class Clock:
+    def __init__(self, period):
+        self.period = float(period)
+        if not self.period > 0:
+            raise ValueError("Sampling period must be positive: {}".format(period))
+        self.condition = threading.Condition()
+        self.tick = 0
+        self.stopped = False
+        self.overruns = 0
+        self.jitter_count = 0
+        self.jitter_sum = 0.0
+        self.jitter_max = 0.0
+        self.missed = {}
+
+    def run(self, kill_event):
+        # Deadlines are multiples of the period from a monotonic origin, so
+        # wake-up latency never accumulates into the schedule. The origin is
+        # on the shared monotonic epoch, so clocks with one period tick
+        # together and their sensors meet in the same inference batch
+        origin = math.ceil(time.monotonic() / self.period) * self.period
+        index = 0
+
+        while True:
+            delay = origin + index * self.period - time.monotonic()
+            if delay > 0 and kill_event.wait(delay):
+                break
+            if kill_event.is_set():
+                break
+
+            lateness = time.monotonic() - (origin + index * self.period)
+            skipped = int(lateness // self.period)
+            if skipped > 0:
+                # Deadlines we slept through are dropped, not delivered late
+                self.overruns += skipped
+                index += skipped
+                lateness -= skipped * self.period
+
+            self.jitter_count += 1
+            self.jitter_sum += lateness
+            self.jitter_max = max(self.jitter_max, lateness)
+
+            with self.condition:
+                self.tick = index + 1
+                self.condition.notify_all()
+
+            index += 1
+
+        self.stop()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def wait(self, last=None, stage=None):
+        # Returns the next tick number after `last`, or None once stopped
+        with self.condition:
+            if last is None:
+                last = self.tick
+            self.condition.wait_for(lambda: self.stopped or self.tick > last)
+            if self.stopped:
+                return None
+            tick = self.tick
+
+        if stage is not None and tick - last > 1:
+            self.missed[stage] = self.missed.get(stage, 0) + tick - last - 1
+
+        return tick
+
+    def stats(self):
+        return {
+            "period": self.period,
+            "tick": self.tick,
+            "overruns": self.overruns,
+            "jitter_mean": (
+                self.jitter_sum / self.jitter_count if self.jitter_count else 0.0
+            ),
+            "jitter_max": self.jitter_max,
+            "missed": dict(self.missed),
+        }
@@ -0,0 +1,115 @@
+import io
+import json
+
+import numpy as np
+from flask import Response, request
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+json_mimetype = "application/json"
+arrow_mimetype = "application/vnd.apache.arrow.stream"
+
+# Sensors sample at up to 100 Hz, so whole seconds would repeat on the chart
+time_unit = "ms"
+
+
+def dumps(res):
+    if orjson is not None:
+        # Float arrays are serialised straight from their buffers
+        return orjson.dumps(res, option=orjson.OPT_SERIALIZE_NUMPY)
+
+    return json.dumps(
+        res, default=lambda value: value.tolist(), separators=(",", ":")
+    ).encode()
+
+
+def event(data, name=None):
+    message = b"data: " + dumps(data) + b"\n\n"
+    if name is not None:
+        message = "event: {}\n".format(name).encode() + message
+
+    return message
+
+
+def respond(res, status=200):
+    return Response(dumps(res), status=status, mimetype=json_mimetype)
+
+
+def get_frame(result, signals):
+    columns = ["signal_{}".format(signal.id) for signal in signals]
+
+    return result.index.values, result[columns].to_numpy(dtype=np.float64)
+
+
+def get_time(date_time):
+    # A single timestamp in the same format as get_columns
+    return str(np.datetime_as_string(np.datetime64(date_time), unit=time_unit))
+
+
+def get_columns(times, values, signals, labels, sep="T"):
+    # Timestamps are formatted once, as a block, and shared by every signal
+    date_time = np.datetime_as_string(times, unit=time_unit)
+    if sep != "T":
+        date_time = np.char.replace(date_time, "T", sep)
+
+    # One contiguous row per signal, as orjson only serialises C-ordered arrays
+    values = np.ascontiguousarray(np.around(values, decimals=3).T)
+
+    columns = []
+    for i, (signal, label) in enumerate(zip(signals, labels)):
+        columns.append(
+            {
+                "id": signal.id,
+                "name": label,
+                "description": signal.description,
+                "value": values[i],
+            }
+        )
+
+    return {"date_time": date_time.tolist(), "values": columns}
+
+
+def get_arrow(times, values, signals, labels):
+    columns = {"date_time": pa.array(times)}
+    for i, signal in enumerate(signals):
+        columns["signal_{}".format(signal.id)] = pa.array(values[:, i])
+
+    table = pa.table(columns)
+    table = table.replace_schema_metadata(
+        {"signal_{}".format(signal.id): label for signal, label in zip(signals, labels)}
+    )
+
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    return sink.getvalue()
+
+
+def respond_frame(times, values, signals, labels, sep="T"):
+    mimetypes = [json_mimetype]
+    if pa is not None:
+        mimetypes.append(arrow_mimetype)
+
+    # Exact timestamp of the newest row, to be passed back as `since`
+    cursor = str(np.datetime_as_string(times[-1], unit="us"))
+
+    if request.accept_mimetypes.best_match(mimetypes) == arrow_mimetype:
+        return Response(
+            get_arrow(times, values, signals, labels),
+            mimetype=arrow_mimetype,
+            headers={"X-Cursor": cursor},
+        )
+
+    data = get_columns(times, values, signals, labels, sep)
+
+    return respond({"status": "success", "data": data, "cursor": cursor})
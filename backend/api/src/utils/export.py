@@ -0,0 +1,99 @@
+import io
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+date_format = "%Y-%m-%d %H:%M:%S.%f"
+
+
+class Sink(io.RawIOBase):
+    # Write-only file object that hands back whatever was written since the
+    # last drain, so encoders can stream into a response chunk by chunk
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def get_metadata(signals):
+    return {
+        "signal_{}".format(signal.id): "{} [{}] ({})".format(
+            signal.name, signal.unit, signal.group
+        )
+        for signal in signals
+    }
+
+
+def get_batch(frame, columns, schema):
+    arrays = [pa.array(frame.index.values, type=pa.timestamp("us"))]
+    for column in columns:
+        arrays.append(pa.array(frame[column].to_numpy(dtype=np.float64)))
+
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def get_schema(columns, signals):
+    fields = [pa.field("date_time", pa.timestamp("us"))]
+    fields += [pa.field(column, pa.float64()) for column in columns]
+
+    return pa.schema(fields, metadata=get_metadata(signals))
+
+
+def to_csv(frames, columns, signals):
+    header = True
+    for frame in frames:
+        # Full float precision, unlike the rounded JSON responses
+        yield frame[columns].to_csv(header=header, date_format=date_format)
+        header = False
+    if header:
+        yield ",".join(["date_time"] + columns) + "\n"
+
+
+def to_arrow(frames, columns, signals):
+    sink = Sink()
+    schema = get_schema(columns, signals)
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for frame in frames:
+            writer.write_batch(get_batch(frame, columns, schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def to_parquet(frames, columns, signals):
+    sink = Sink()
+    schema = get_schema(columns, signals)
+    with pq.ParquetWriter(sink, schema) as writer:
+        for frame in frames:
+            # One row group per chunk
+            writer.write_batch(get_batch(frame, columns, schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+formats = {"csv": ("text/csv", to_csv)}
+if pa is not None:
+    formats["arrow"] = ("application/vnd.apache.arrow.stream", to_arrow)
+    formats["parquet"] = ("application/vnd.apache.parquet", to_parquet)
@@ -0,0 +1,49 @@
+import time
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from src import app, db
+from src.config import SENSOR_QUEUE_SIZE
+from src.utils.broadcast import Broadcaster
+from src.utils.storage import storage
+
+
+class Follower:
+    # Tails the stored samples of a sensor whose pipeline runs in another
+    # process, one poll per sampling period however many clients listen
+    def __init__(self, sensor, columns):
+        self.Sensor = type(sensor)
+        self.sensor_id = sensor.id
+        self.period = sensor.sampling_period
+        self.columns = columns
+        self.broadcaster = Broadcaster(SENSOR_QUEUE_SIZE)
+        self.thread = threading.Thread(
+            target=self.run, name="sensor-{}-follow".format(sensor.id), daemon=True
+        )
+
+    def start(self):
+        self.thread.start()
+
+    def is_alive(self):
+        return self.thread.is_alive()
+
+    def is_active(self):
+        with app.app_context():
+            sensor = db.session.get(self.Sensor, self.sensor_id)
+            return sensor is not None and sensor.state
+
+    def run(self):
+        cursor = datetime.now()
+        try:
+            while len(self.broadcaster) > 0 and self.is_active():
+                result = storage.read_latest(self.sensor_id, self.columns, None, cursor)
+                values = result[self.columns].to_numpy(dtype=np.float64)
+                for date_time, row in zip(result.index, values):
+                    cursor = date_time.to_pydatetime()
+                    self.broadcaster.publish((cursor, row))
+
+                time.sleep(self.period)
+        finally:
+            self.broadcaster.close()
@@ -0,0 +1,193 @@
+import time
+import threading
+from queue import Queue, Empty
+
+import torch
+
+from src.config import INFERENCE_BATCH_WINDOW
+from src.utils.registry import registry, device
+
+# Batch dimension of every argument and output of the batched methods
+batch_dims = {
+    "step": ((0, 0, 1, 1), (0, 1, 1)),
+    "forward": ((0, 0), (0,)),
+}
+
+
+def step(repeater, x, y, h, c):
+    # Models exported before `Repeater.step` existed only script `forward`
+    if hasattr(repeater, "step"):
+        return repeater.step(x, y, h, c)
+
+    lstm = repeater.lstm
+    forward = lstm.forward__0 if hasattr(lstm, "forward__0") else lstm
+    output, (h, c) = forward(torch.cat((x, y), dim=2), (h, c))
+
+    return repeater.linear(output), h, c
+
+
+def forward(repeater, x, y):
+    return (repeater.forward(x, y),)
+
+
+methods = {"step": step, "forward": forward}
+
+
+def warmup(model_path, runs=2):
+    # The profiling executor specialises the graph over the first runs
+    key, repeater = registry.acquire(model_path)
+    try:
+        x = torch.zeros(1, repeater.lag, len(repeater.x_min_)).to(device)
+        y = torch.zeros(1, repeater.lag, len(repeater.y_min_)).to(device)
+        h = torch.zeros(repeater.num_layers, 1, repeater.hidden_size).to(device)
+        c = torch.zeros(repeater.num_layers, 1, repeater.hidden_size).to(device)
+        with torch.inference_mode():
+            for _ in range(runs):
+                step(repeater, x[:, -1:], y[:, -1:], h, c)
+                forward(repeater, x, y)
+    finally:
+        registry.release(key)
+
+
+class Request:
+    def __init__(self, method, args, period=None):
+        self.method = method
+        self.args = args
+        self.period = period
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.elapsed = 0.0
+
+
+class Scheduler:
+    def __init__(self, key, model, window=INFERENCE_BATCH_WINDOW):
+        self.key = key
+        self.model = model
+        self.window = window
+        self.users = 0
+        self.periods = {}
+        self.queue = Queue()
+        self.thread = threading.Thread(
+            target=self.run, name="inference-{}".format(key[:12]), daemon=True
+        )
+        self.thread.start()
+
+    def submit(self, method, *args, period=None, histogram=None):
+        request = Request(method, args, period)
+        self.queue.put(request)
+        request.event.wait()
+
+        if request.error is not None:
+            raise request.error
+
+        if histogram is not None:
+            histogram.observe(request.elapsed)
+
+        return request.result
+
+    def close(self):
+        self.queue.put(None)
+
+    def collect(self, request):
+        # Wait briefly for the other sensors on this model ticking at the same
+        # period; their clocks share an epoch, so they submit together
+        requests = [request]
+        expected = self.periods.get(request.period, self.users)
+        deadline = time.monotonic() + self.window
+
+        while len(requests) < expected:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=timeout)
+            except Empty:
+                break
+            if request is None:
+                self.queue.put(None)
+                break
+            requests.append(request)
+
+        return requests
+
+    def execute(self, requests):
+        method = requests[0].method
+        arg_dims, out_dims = batch_dims[method]
+
+        args = [
+            torch.cat([request.args[i] for request in requests], dim=dim)
+            for i, dim in enumerate(arg_dims)
+        ]
+        start = time.perf_counter()
+        with torch.inference_mode():
+            outputs = methods[method](self.model, *args)
+        # The batched forward is shared, so every request reports its full cost
+        elapsed = time.perf_counter() - start
+
+        splits = [
+            torch.split(output, 1, dim=dim) for output, dim in zip(outputs, out_dims)
+        ]
+        for i, request in enumerate(requests):
+            result = tuple(split[i] for split in splits)
+            request.result = result if len(result) > 1 else result[0]
+            request.elapsed = elapsed
+
+    def run(self):
+        while True:
+            request = self.queue.get()
+            if request is None:
+                break
+
+            groups = {}
+            for request in self.collect(request):
+                # Requests only stack when every non-batch dimension matches
+                key = (request.method,) + tuple(
+                    tuple(arg.shape[:dim]) + tuple(arg.shape[dim + 1 :])
+                    for arg, dim in zip(request.args, batch_dims[request.method][0])
+                )
+                groups.setdefault(key, []).append(request)
+
+            for requests in groups.values():
+                try:
+                    self.execute(requests)
+                except Exception as err:
+                    for request in requests:
+                        request.error = err
+                for request in requests:
+                    request.event.set()
+
+
+class Schedulers:
+    def __init__(self):
+        self.schedulers = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, model_path, period=None):
+        # Keyed by the model's digest, so copies of one file share a
+        # scheduler too
+        key, model = registry.acquire(model_path)
+        with self.lock:
+            scheduler = self.schedulers.get(key)
+            if scheduler is None:
+                scheduler = Scheduler(key, model)
+                self.schedulers[key] = scheduler
+            scheduler.users += 1
+            scheduler.periods[period] = scheduler.periods.get(period, 0) + 1
+
+        return scheduler
+
+    def release(self, scheduler, period=None):
+        with self.lock:
+            scheduler.users -= 1
+            scheduler.periods[period] -= 1
+            if scheduler.periods[period] <= 0:
+                del scheduler.periods[period]
+            if scheduler.users <= 0:
+                if self.schedulers.get(scheduler.key) is scheduler:
+                    del self.schedulers[scheduler.key]
+                scheduler.close()
+        registry.release(scheduler.key)
+
+
+schedulers = Schedulers()
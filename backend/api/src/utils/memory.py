@@ -0,0 +1,115 @@
+import os
+import gc
+import time
+import ctypes
+import threading
+
+from src.config import MEMORY_RSS_GROWTH, MEMORY_GC_INTERVAL, MEMORY_TRIM_INTERVAL
+
+
+def load_trim():
+    try:
+        return ctypes.CDLL("libc.so.6").malloc_trim
+    except (OSError, AttributeError):
+        # Not glibc: nothing to trim
+        return None
+
+
+class MemoryManager:
+    def __init__(
+        self,
+        rss_growth=MEMORY_RSS_GROWTH,
+        gc_interval=MEMORY_GC_INTERVAL,
+        trim_interval=MEMORY_TRIM_INTERVAL,
+    ):
+        self.rss_growth = rss_growth
+        self.gc_interval = gc_interval
+        self.trim_interval = trim_interval
+        self.malloc_trim = load_trim()
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+        self.lock = threading.Lock()
+
+        now = time.monotonic()
+        self.baseline = self.rss()
+        self.last_collect = now
+        self.last_trim = now
+
+        self.checks = 0
+        self.collections = 0
+        self.collected = 0
+        self.trims = 0
+        self.released = 0
+        self.pause_sum = 0.0
+        self.pause_max = 0.0
+        self.peak = self.baseline
+
+    def rss(self):
+        # Current resident set, read without spawning anything
+        try:
+            with open("/proc/self/statm") as file:
+                return int(file.read().split()[1]) * self.page_size
+        except (OSError, IndexError, ValueError):
+            return 0
+
+    def check(self):
+        # Called by every sensor's clean stage; one of them does the work
+        if not self.lock.acquire(blocking=False):
+            return
+
+        try:
+            self.checks += 1
+            now = time.monotonic()
+            rss = self.rss()
+            self.peak = max(self.peak, rss)
+
+            grown = rss - self.baseline > self.rss_growth
+            if not grown and now - self.last_collect < self.gc_interval:
+                return
+
+            # Full collections stop every thread, so only run them when
+            # memory actually grew or as a slow backstop
+            start = time.perf_counter()
+            self.collected += gc.collect()
+            self.collections += 1
+            self.last_collect = now
+
+            after = self.rss()
+            if (
+                self.malloc_trim is not None
+                and after - self.baseline > self.rss_growth
+                and now - self.last_trim >= self.trim_interval
+            ):
+                # Freed objects still held by the allocator go back to the OS
+                self.malloc_trim(0)
+                self.trims += 1
+                self.last_trim = now
+                trimmed = self.rss()
+                self.released += max(0, after - trimmed)
+                after = trimmed
+
+            pause = time.perf_counter() - start
+            self.pause_sum += pause
+            self.pause_max = max(self.pause_max, pause)
+            self.baseline = after
+        finally:
+            self.lock.release()
+
+    def stats(self):
+        return {
+            "rss": self.rss(),
+            "peak": self.peak,
+            "baseline": self.baseline,
+            "checks": self.checks,
+            "collections": self.collections,
+            "collected": self.collected,
+            "trims": self.trims,
+            "released": self.released,
+            "pause_max": self.pause_max,
+            "pause_mean": (
+                self.pause_sum / self.collections if self.collections > 0 else 0.0
+            ),
+            "gc_counts": gc.get_count(),
+        }
+
+
+memory = MemoryManager()
@@ -0,0 +1,125 @@
+import bisect
+import threading
+
+
+# Upper bounds in seconds, from sub-millisecond stages to a late tick
+buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+stages = ("receive", "process", "inference", "forward", "transmit", "latency")
+
+
+class Histogram:
+    def __init__(self, buckets=buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def snapshot(self):
+        with self.lock:
+            counts = list(self.counts)
+            count, total, peak = self.count, self.sum, self.max
+
+        cumulative = []
+        n = 0
+        for le, c in zip(list(self.buckets) + ["+Inf"], counts):
+            n += c
+            cumulative.append([le, n])
+
+        return {
+            "count": count,
+            "sum": total,
+            "mean": total / count if count > 0 else 0.0,
+            "max": peak,
+            "buckets": cumulative,
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self.histograms = {stage: Histogram() for stage in stages}
+
+    def observe(self, stage, value):
+        self.histograms[stage].observe(value)
+
+    def snapshot(self):
+        return {stage: self.histograms[stage].snapshot() for stage in stages}
+
+
+def get_labels(**labels):
+    return ",".join('{}="{}"'.format(key, value) for key, value in labels.items())
+
+
+def to_prometheus(pipelines):
+    # Text exposition format 0.0.4 built from `Pipeline.stats` dictionaries,
+    # so in-process and worker-process pipelines are exported alike
+    families = {
+        "sgr_stage_seconds": ("histogram", "Time per tick spent in each stage."),
+        "sgr_queue_depth": ("gauge", "Items waiting in a pipeline queue."),
+        "sgr_queue_dropped_total": ("counter", "Items dropped by a full queue."),
+        "sgr_ticks_total": ("counter", "Clock ticks since the sensor started."),
+        "sgr_ticks_missed_total": ("counter", "Ticks a stage was too late for."),
+        "sgr_clock_overruns_total": ("counter", "Deadlines the clock skipped."),
+        "sgr_clock_jitter_max_seconds": ("gauge", "Largest clock wake-up delay."),
+        "sgr_subscribers": ("gauge", "Clients on the live stream."),
+        "sgr_memory_rss_bytes": ("gauge", "Resident memory of the process."),
+        "sgr_memory_collections_total": ("counter", "Full collections run."),
+    }
+    samples = {name: [] for name in families}
+
+    for sensor_id, stats in pipelines.items():
+        sensor = {"sensor_id": sensor_id}
+
+        for stage, histogram in stats.get("stages", {}).items():
+            labels = get_labels(**sensor, stage=stage)
+            for le, n in histogram["buckets"]:
+                samples["sgr_stage_seconds"].append(
+                    ("_bucket", '{},le="{}"'.format(labels, le), n)
+                )
+            samples["sgr_stage_seconds"].append(("_sum", labels, histogram["sum"]))
+            samples["sgr_stage_seconds"].append(("_count", labels, histogram["count"]))
+
+        for queue, values in stats.get("queues", {}).items():
+            labels = get_labels(**sensor, queue=queue)
+            samples["sgr_queue_depth"].append(("", labels, values["size"]))
+            samples["sgr_queue_dropped_total"].append(("", labels, values["dropped"]))
+
+        clock = stats.get("clock", {})
+        labels = get_labels(**sensor)
+        samples["sgr_ticks_total"].append(("", labels, clock.get("tick", 0)))
+        for stage, missed in clock.get("missed", {}).items():
+            samples["sgr_ticks_missed_total"].append(
+                ("", get_labels(**sensor, stage=stage), missed)
+            )
+        samples["sgr_clock_overruns_total"].append(
+            ("", labels, clock.get("overruns", 0))
+        )
+        samples["sgr_clock_jitter_max_seconds"].append(
+            ("", labels, clock.get("jitter_max", 0.0))
+        )
+        samples["sgr_subscribers"].append(("", labels, stats.get("subscribers", 0)))
+
+        memory = stats.get("memory", {})
+        samples["sgr_memory_rss_bytes"].append(("", labels, memory.get("rss", 0)))
+        samples["sgr_memory_collections_total"].append(
+            ("", labels, memory.get("collections", 0))
+        )
+
+    lines = []
+    for name, (kind, description) in families.items():
+        lines.append("# HELP {} {}".format(name, description))
+        lines.append("# TYPE {} {}".format(name, kind))
+        for suffix, labels, value in samples[name]:
+            lines.append("{}{}{{{}}} {}".format(name, suffix, labels, value))
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,89 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+import torch
+
+from src.config import MODEL_CACHE_SIZE
+
+
+device = "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def get_digest(path, chunk_size=2**20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class Registry:
+    def __init__(self, capacity=MODEL_CACHE_SIZE):
+        self.capacity = capacity
+        self.models = OrderedDict()
+        self.users = {}
+        self.digests = {}
+        self.paths = {}
+        self.lock = threading.Lock()
+
+    def get_key(self, model_path):
+        path = os.path.realpath(model_path)
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        # Files are only re-hashed when they change on disk
+        cached = self.digests.get(path)
+        if cached is None or cached[0] != signature:
+            cached = (signature, get_digest(path))
+            self.digests[path] = cached
+
+        return path, cached[1]
+
+    def acquire(self, model_path):
+        with self.lock:
+            # Keyed by content alone, so copies of one file share a model
+            path, key = self.get_key(model_path)
+            model = self.models.get(key)
+            if model is None:
+                model = torch.jit.load(path, map_location=device)
+                model.eval()
+                self.models[key] = model
+                self.paths[key] = path
+            self.models.move_to_end(key)
+            self.users[key] = self.users.get(key, 0) + 1
+            self.evict()
+
+        return key, model
+
+    def release(self, key):
+        with self.lock:
+            self.users[key] = self.users.get(key, 0) - 1
+            if self.users[key] <= 0:
+                del self.users[key]
+            self.evict()
+
+    def evict(self):
+        # Least recently used first; models still in use are never dropped
+        for key in list(self.models):
+            if len(self.models) <= self.capacity:
+                break
+            if key not in self.users:
+                del self.models[key]
+                del self.paths[key]
+
+    def stats(self):
+        with self.lock:
+            return [
+                {
+                    "path": self.paths[digest],
+                    "sha256": digest,
+                    "users": self.users.get(digest, 0),
+                }
+                for digest in self.models
+            ]
+
+
+registry = Registry()
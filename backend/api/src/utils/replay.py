@@ -0,0 +1,198 @@
+import numpy as np
+import torch
+
+from src.config import SENSOR_INFERENCE
+from src.utils.buffer import Window
+from src.utils.inference import step
+from src.utils.registry import device
+from src.utils.scaler import Scaler
+
+# Largest scaled difference between the unrolled and the model's own step
+# for the unrolled one to be used
+UNROLL_TOLERANCE = 1e-4
+
+
+def is_plain(repeater):
+    # Only a plain LSTM feeding a linear head can be unrolled
+    lstm = getattr(repeater, "lstm", None)
+    linear = getattr(repeater, "linear", None)
+    if lstm is None or linear is None:
+        return False
+
+    names = {
+        "{}_{}_l{}".format(kind, part, k)
+        for k in range(repeater.num_layers)
+        for kind in ("weight", "bias")
+        for part in ("ih", "hh")
+    }
+    return (
+        getattr(lstm, "original_name", type(lstm).__name__) == "LSTM"
+        and getattr(linear, "original_name", type(linear).__name__) == "Linear"
+        and {name for name, _ in lstm.named_parameters()} == names
+        and {name for name, _ in linear.named_parameters()} == {"weight", "bias"}
+    )
+
+
+class Replay:
+    # The Repeater's LSTM and linear head unrolled in NumPy. Offline runs are
+    # strictly sequential (every step feeds back the previous output), so
+    # the cost is per-step dispatch, where plain NumPy on 1-row vectors
+    # beats a TorchScript call several times over. Any other model, or the
+    # window mode, runs the same loop as `Sensor.infer` on the model itself
+    def __init__(self, repeater, mode=SENSOR_INFERENCE):
+        self.repeater = repeater
+        self.mode = mode
+        self.lag = repeater.lag
+        self.num_layers = repeater.num_layers
+        self.hidden_size = repeater.hidden_size
+        self.x_scaler = Scaler.from_model(repeater, "x_")
+        self.y_scaler = Scaler.from_model(repeater, "y_", np.float64)
+        self.x_size = len(self.x_scaler.min)
+        self.y_size = len(self.y_scaler.min)
+
+        self.unrolled = mode == "stream" and is_plain(repeater)
+        if self.unrolled:
+            self.unroll(repeater)
+            self.unrolled = self.check()
+
+    def unroll(self, repeater):
+        parameters = {
+            name: value.detach().cpu().numpy().astype(np.float32)
+            for name, value in repeater.lstm.named_parameters()
+        }
+        # Gates of layer k are [input, hidden] @ weights[k] + biases[k]. The
+        # i, f and o rows are halved so that one tanh over all four gates
+        # also yields their sigmoids, as sigmoid(x) = (1 + tanh(x / 2)) / 2
+        size = self.hidden_size
+        half = np.ones(4 * size, dtype=np.float32)
+        half[: 2 * size] = 0.5
+        half[3 * size :] = 0.5
+
+        self.weights = []
+        self.biases = []
+        for k in range(self.num_layers):
+            weight = np.concatenate(
+                (
+                    parameters["weight_ih_l{}".format(k)],
+                    parameters["weight_hh_l{}".format(k)],
+                ),
+                axis=1,
+            )
+            bias = (
+                parameters["bias_ih_l{}".format(k)]
+                + parameters["bias_hh_l{}".format(k)]
+            )
+            self.weights.append(np.ascontiguousarray((weight * half[:, None]).T))
+            self.biases.append(bias * half)
+
+        self.linear_weight = (
+            repeater.linear.weight.detach().cpu().numpy().astype(np.float32).T.copy()
+        )
+        self.linear_bias = (
+            repeater.linear.bias.detach().cpu().numpy().astype(np.float32).copy()
+        )
+
+    def check(self):
+        # A scripted `step` may do more than the LSTM and the head, so the
+        # unrolled steps must reproduce it on a short random sequence
+        generator = np.random.default_rng(0)
+        x = generator.uniform(-1, 1, (self.lag, self.x_size)).astype(np.float32)
+        y = generator.uniform(-1, 1, (self.lag, self.y_size)).astype(np.float32)
+
+        h = [np.zeros(self.hidden_size, dtype=np.float32)] * self.num_layers
+        c = [np.zeros(self.hidden_size, dtype=np.float32)] * self.num_layers
+        gates_x = x @ self.weights[0][: self.x_size] + self.biases[0]
+        z = np.array([self.step(gates_x[t], y[t], h, c) for t in range(self.lag)])
+
+        with torch.inference_mode():
+            h = torch.zeros(self.num_layers, 1, self.hidden_size).to(device)
+            c = torch.zeros(self.num_layers, 1, self.hidden_size).to(device)
+            z_model, _, _ = step(
+                self.repeater,
+                torch.from_numpy(x).unsqueeze(0).to(device),
+                torch.from_numpy(y).unsqueeze(0).to(device),
+                h,
+                c,
+            )
+
+        return bool(np.abs(z - z_model[0].cpu().numpy()).max() < UNROLL_TOLERANCE)
+
+    def cell(self, gates, c):
+        size = self.hidden_size
+        t = np.tanh(gates)
+        s = t * 0.5 + 0.5
+        c = s[size : 2 * size] * c + s[:size] * t[2 * size : 3 * size]
+
+        return s[3 * size :] * np.tanh(c), c
+
+    def step(self, gates_x, y, h, c):
+        # Layer 0's input projection is precomputed for the whole series
+        output, c[0] = self.cell(
+            gates_x + np.concatenate((y, h[0])) @ self.weights[0][self.x_size :], c[0]
+        )
+        h[0] = output
+        for k in range(1, self.num_layers):
+            output, c[k] = self.cell(
+                np.concatenate((output, h[k])) @ self.weights[k] + self.biases[k], c[k]
+            )
+            h[k] = output
+
+        return output @ self.linear_weight + self.linear_bias
+
+    def run(self, x):
+        if not self.unrolled:
+            return self.run_model(x)
+
+        x_scaled = self.x_scaler.transform(np.asarray(x)).astype(np.float32)
+        weight = self.weights[0][: self.x_size]
+        gates_x = x_scaled @ weight + self.biases[0]
+
+        h = [np.zeros(self.hidden_size, dtype=np.float32)] * self.num_layers
+        c = [np.zeros(self.hidden_size, dtype=np.float32)] * self.num_layers
+        z = np.zeros(len(self.y_scaler.min), dtype=np.float32)
+
+        # Same warm start as `Sensor.infer`: lag - 1 steps of the primed
+        # window, an all-zero input history with zero outputs
+        gates_warm = self.x_scaler.min @ weight + self.biases[0]
+        for _ in range(self.lag - 1):
+            self.step(gates_warm, z, h, c)
+
+        outputs = np.empty((len(x_scaled), len(z)), dtype=np.float32)
+        for t in range(len(x_scaled)):
+            z = self.step(gates_x[t], z, h, c)
+            outputs[t] = z
+
+        return self.y_scaler.inverse_transform(outputs)
+
+    def run_model(self, x):
+        # The loop of `Sensor.infer`, one call into the model per step
+        repeater = self.repeater
+        x_window = Window(self.lag, self.x_size, fill=self.x_scaler.min)
+        y_window = Window(self.lag, self.y_size)
+        outputs = np.empty((len(x), self.y_size), dtype=np.float32)
+
+        with torch.inference_mode():
+            if self.mode == "stream":
+                h = torch.zeros(self.num_layers, 1, self.hidden_size).to(device)
+                c = torch.zeros(self.num_layers, 1, self.hidden_size).to(device)
+                x_scaled = torch.from_numpy(x_window.view()[1:]).unsqueeze(0)
+                y_scaled = torch.from_numpy(y_window.view()[1:]).unsqueeze(0)
+                _, h, c = step(repeater, x_scaled.to(device), y_scaled.to(device), h, c)
+
+            for t, row in enumerate(np.asarray(x)):
+                x_window.push(self.x_scaler.transform(row))
+                if self.mode == "stream":
+                    x_scaled = torch.from_numpy(x_window.view()[-1:]).unsqueeze(0)
+                    y_scaled = torch.from_numpy(y_window.view()[-1:]).unsqueeze(0)
+                    z, h, c = step(
+                        repeater, x_scaled.to(device), y_scaled.to(device), h, c
+                    )
+                else:
+                    x_scaled = torch.from_numpy(x_window.view()).unsqueeze(0)
+                    y_scaled = torch.from_numpy(y_window.view()).unsqueeze(0)
+                    z = repeater.forward(x_scaled.to(device), y_scaled.to(device))
+
+                outputs[t] = z[0, -1, :].cpu().numpy()
+                y_window.push(outputs[t])
+
+        return self.y_scaler.inverse_transform(outputs)
@@ -0,0 +1,153 @@
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from src import app, db
+from src.config import (
+    RUNNER_INTERVAL,
+    RUNNER_STATS_PORT,
+    RUNNER_STATS_URL,
+    SENSOR_RESTART_BACKOFF,
+)
+from src.models.sensor_model import Sensor
+from src.models.signal_model import Signal
+from src.utils.encoder import dumps, json_mimetype
+from src.utils.metrics import to_prometheus
+from src.utils.runtime import runtime
+
+
+def get_stats(timeout=2.0):
+    # What the runner's pipelines report, keyed by sensor id like runtime.stats()
+    response = requests.get(RUNNER_STATS_URL + "/stats", timeout=timeout)
+    response.raise_for_status()
+
+    return {int(sensor_id): stats for sensor_id, stats in response.json().items()}
+
+
+class StatsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/stats":
+            stats = runtime.stats()
+            body = dumps({str(sensor_id): value for sensor_id, value in stats.items()})
+            mimetype = json_mimetype
+        elif self.path == "/metrics":
+            body = to_prometheus(runtime.stats()).encode()
+            mimetype = "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", mimetype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Runner:
+    # Owns every pipeline and converges them on `Sensor.state`, which the
+    # API (any number of workers) only ever writes to the database
+    def __init__(self, interval=RUNNER_INTERVAL, port=RUNNER_STATS_PORT):
+        self.interval = interval
+        self.port = port
+        self.kill_event = threading.Event()
+        self.setpoints = {}
+        self.started = {}
+        self.failures = {}
+        self.retry = {}
+
+    def reconcile(self):
+        with app.app_context():
+            sensors = {sensor.id: sensor for sensor in Sensor.query.all()}
+            desired = {
+                sensor_id for sensor_id, sensor in sensors.items() if sensor.state
+            }
+
+            for sensor_id in list(runtime.pipelines):
+                if sensor_id not in desired:
+                    print("Stopping sensor {}...".format(sensor_id))
+                    sensor = sensors.get(sensor_id)
+                    timeout = 1 if sensor is None else sensor.sampling_period + 1
+                    runtime.stop(sensor_id, timeout=timeout)
+                    self.setpoints.pop(sensor_id, None)
+
+            for sensor_id in list(self.failures):
+                if sensor_id not in desired:
+                    del self.failures[sensor_id]
+                    self.retry.pop(sensor_id, None)
+
+            now = time.monotonic()
+            for sensor_id in desired:
+                if runtime.is_running(sensor_id):
+                    continue
+
+                if runtime.get(sensor_id) is not None:
+                    # Back off exponentially, as the process supervisor does;
+                    # a pipeline that ran longer than the longest delay starts over
+                    if now - self.started[sensor_id] > SENSOR_RESTART_BACKOFF:
+                        self.failures[sensor_id] = 0
+                    failures = self.failures.get(sensor_id, 0) + 1
+                    self.failures[sensor_id] = failures
+                    delay = min(2 ** (failures - 1), SENSOR_RESTART_BACKOFF)
+                    print(
+                        "Sensor {} stopped unexpectedly, restarting in {}s...".format(
+                            sensor_id, delay
+                        )
+                    )
+                    runtime.stop(sensor_id, timeout=0)
+                    self.retry[sensor_id] = now + delay
+
+                if now < self.retry.get(sensor_id, 0):
+                    continue
+
+                print("Running sensor {}...".format(sensor_id))
+                runtime.start(sensors[sensor_id], Signal)
+                self.started[sensor_id] = now
+                self.setpoints[sensor_id] = {}
+
+            # Setpoint edits made through the API reach running pipelines here
+            if len(desired) > 0:
+                signals = Signal.query.filter(
+                    Signal.sensor_id.in_(desired), Signal.group == "input"
+                )
+                for signal in signals:
+                    setpoints = self.setpoints.setdefault(signal.sensor_id, {})
+                    if setpoints.get(signal.id) != signal.setpoint:
+                        if signal.id in setpoints:
+                            runtime.set_setpoint(
+                                signal.sensor_id, signal.id, signal.setpoint
+                            )
+                        setpoints[signal.id] = signal.setpoint
+
+            db.session.remove()
+
+    def run(self):
+        # Loopback only: the API in the same container is the one reader
+        server = ThreadingHTTPServer(("127.0.0.1", self.port), StatsHandler)
+        server.daemon_threads = True
+        thread = threading.Thread(
+            target=server.serve_forever, name="runner-stats", daemon=True
+        )
+        thread.start()
+
+        try:
+            while not self.kill_event.is_set():
+                try:
+                    self.reconcile()
+                except Exception as err:
+                    print("Reconcile failed: {!r}".format(err))
+                self.kill_event.wait(self.interval)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        # Sensor.state is left as is, so the next runner resumes the same set
+        runtime.stop_all(timeout=self.interval + 1)
+
+    def stop(self):
+        self.kill_event.set()
@@ -0,0 +1,241 @@
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+
+from src.config import SENSOR_QUEUE_SIZE, SENSOR_QUEUE_POLICY, SENSOR_EXECUTOR
+from src.utils.broadcast import Broadcaster
+from src.utils.buffer import History
+from src.utils.follower import Follower
+from src.utils.memory import memory
+from src.utils.metrics import Metrics
+from src.utils.channel import Channel
+from src.utils.clock import Clock
+
+
+def get_signals(signals):
+    # Plain copies of the fields /points labels rows with, readable without
+    # a session long after the rows were loaded
+    return [
+        SimpleNamespace(
+            id=signal.id,
+            name=signal.name,
+            unit=signal.unit,
+            description=signal.description,
+            group=signal.group,
+        )
+        for signal in signals
+    ]
+
+
+class Setpoints:
+    def __init__(self, signals):
+        self.index = {signal.id: i for i, signal in enumerate(signals)}
+        self.values = np.array(
+            [signal.setpoint for signal in signals], dtype=np.float64
+        )
+
+    def set(self, signal_id, value):
+        i = self.index.get(signal_id)
+        if i is not None:
+            self.values[i] = value
+
+    def get(self):
+        return self.values.copy()
+
+
+class Pipeline:
+    def __init__(self, sensor, Signal):
+        self.sensor = sensor
+        self.Signal = Signal
+        signals = (
+            Signal.query.filter_by(sensor_id=sensor.id).order_by(Signal.id.asc()).all()
+        )
+        columns, _, _ = sensor.get_fields(signals)
+        self.signals = get_signals(signals)
+        self.setpoints = Setpoints(
+            [signal for signal in signals if signal.group == "input"]
+        )
+        self.history = History(sensor.buffer, columns)
+        self.clock = Clock(sensor.sampling_period)
+        self.kill_event = threading.Event()
+        self.input_queue = Channel(SENSOR_QUEUE_SIZE, SENSOR_QUEUE_POLICY)
+        self.output_queue = Channel(SENSOR_QUEUE_SIZE, SENSOR_QUEUE_POLICY)
+        self.broadcaster = Broadcaster(SENSOR_QUEUE_SIZE)
+        self.metrics = Metrics()
+        self.threads = []
+
+    def start(self):
+        sensor = self.sensor
+        stages = {
+            "clock": (sensor.clock, (self.clock, self.kill_event)),
+            "receive": (
+                sensor.receive,
+                (self.setpoints, self.input_queue, self.clock, self.metrics),
+            ),
+            "process": (
+                sensor.process,
+                (self.input_queue, self.output_queue, self.metrics),
+            ),
+            "transmit": (
+                sensor.transmit,
+                (
+                    self.Signal,
+                    self.output_queue,
+                    self.history,
+                    self.broadcaster,
+                    self.metrics,
+                ),
+            ),
+            "clean": (sensor.clean, (self.clock,)),
+        }
+
+        for name, (target, args) in stages.items():
+            thread = threading.Thread(
+                target=self.run,
+                args=(target, args),
+                name="sensor-{}-{}".format(sensor.id, name),
+                daemon=True,
+            )
+            thread.start()
+            self.threads.append(thread)
+
+    def run(self, target, args):
+        try:
+            target(*args)
+        finally:
+            # One stage ending takes the whole pipeline down, so that it is
+            # seen as stopped and can be started again
+            self.kill_event.set()
+
+    def stop(self, timeout=None):
+        self.kill_event.set()
+
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def stats(self):
+        return {
+            "clock": self.clock.stats(),
+            "stages": self.metrics.snapshot(),
+            "queues": {
+                "input": {
+                    "size": len(self.input_queue),
+                    "dropped": self.input_queue.dropped,
+                },
+                "output": {
+                    "size": len(self.output_queue),
+                    "dropped": self.output_queue.dropped,
+                },
+            },
+            "history": len(self.history),
+            "subscribers": len(self.broadcaster),
+            "memory": memory.stats(),
+        }
+
+    def is_alive(self):
+        return len(self.threads) > 0 and all(
+            thread.is_alive() for thread in self.threads
+        )
+
+
+class Runtime:
+    def __init__(self):
+        self.pipelines = {}
+        self.followers = {}
+        self.lock = threading.Lock()
+
+    def start(self, sensor, Signal):
+        with self.lock:
+            pipeline = self.pipelines.get(sensor.id)
+            if pipeline is not None and pipeline.is_alive():
+                return False
+            if pipeline is not None:
+                # A stage died; make sure the rest of it winds down too
+                pipeline.kill_event.set()
+
+            if SENSOR_EXECUTOR == "process":
+                # Imported here, the worker module itself builds on Pipeline
+                from src.utils.worker import ProcessPipeline
+
+                pipeline = ProcessPipeline(sensor, Signal)
+            else:
+                pipeline = Pipeline(sensor, Signal)
+            pipeline.start()
+            self.pipelines[sensor.id] = pipeline
+
+        return True
+
+    def stop(self, sensor_id, timeout=None):
+        with self.lock:
+            pipeline = self.pipelines.pop(sensor_id, None)
+
+        if pipeline is None:
+            return False
+
+        pipeline.stop(timeout)
+
+        return True
+
+    def stop_all(self, timeout=None):
+        with self.lock:
+            pipelines = list(self.pipelines.values())
+            self.pipelines.clear()
+
+        for pipeline in pipelines:
+            pipeline.kill_event.set()
+
+        for pipeline in pipelines:
+            pipeline.stop(timeout)
+
+    def is_running(self, sensor_id):
+        pipeline = self.pipelines.get(sensor_id)
+
+        return pipeline is not None and pipeline.is_alive()
+
+    def get(self, sensor_id):
+        return self.pipelines.get(sensor_id)
+
+    def stats(self):
+        with self.lock:
+            pipelines = list(self.pipelines.items())
+
+        return {
+            sensor_id: pipeline.stats()
+            for sensor_id, pipeline in pipelines
+            if pipeline.is_alive()
+        }
+
+    def subscribe(self, sensor_id):
+        pipeline = self.pipelines.get(sensor_id)
+        if pipeline is None or not pipeline.is_alive():
+            return None
+
+        return pipeline.broadcaster.subscribe()
+
+    def follow(self, sensor, columns):
+        with self.lock:
+            follower = self.followers.get(sensor.id)
+            if follower is None or not follower.is_alive():
+                follower = Follower(sensor, columns)
+                self.followers[sensor.id] = follower
+                channel = follower.broadcaster.subscribe()
+                follower.start()
+            else:
+                channel = follower.broadcaster.subscribe()
+
+        return channel
+
+    def unsubscribe(self, sensor_id, channel):
+        for owner in (self.pipelines.get(sensor_id), self.followers.get(sensor_id)):
+            if owner is not None:
+                owner.broadcaster.unsubscribe(channel)
+        channel.close()
+
+    def set_setpoint(self, sensor_id, signal_id, value):
+        pipeline = self.pipelines.get(sensor_id)
+        if pipeline is not None:
+            pipeline.setpoints.set(signal_id, value)
+
+
+runtime = Runtime()
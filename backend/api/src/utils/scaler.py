@@ -0,0 +1,23 @@
+import numpy as np
+
+
+class Scaler:
+    # MinMaxScaler.transform and inverse_transform reduced to their affine
+    # maps, without sklearn's per-call validation
+    def __init__(self, min_, scale_, dtype=np.float32):
+        self.min = np.asarray(min_, dtype=dtype)
+        self.scale = np.asarray(scale_, dtype=dtype)
+
+    @classmethod
+    def from_model(cls, model, prefix, dtype=np.float32):
+        return cls(
+            getattr(model, "{}min_".format(prefix)),
+            getattr(model, "{}scale_".format(prefix)),
+            dtype,
+        )
+
+    def transform(self, x):
+        return x * self.scale + self.min
+
+    def inverse_transform(self, z):
+        return (z - self.min) / self.scale
@@ -0,0 +1,464 @@
+import math
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+
+import pandas as pd
+from sqlalchemy import text
+
+from src import engine, config
+from src.models.data_model import (
+    resolutions,
+    create_table,
+    get_table_name,
+    has_table,
+    drop_table,
+)
+from src.utils.writer import Writer, Rollup, date_format
+
+
+aggregates = {"mean": "AVG", "min": "MIN", "max": "MAX"}
+
+# How each aggregate is recombined from rollup sums, counts and extremes
+rollup_aggregates = {
+    "mean": "SUM({0}_sum) / SUM(count)",
+    "min": "MIN({0}_min)",
+    "max": "MAX({0}_max)",
+}
+
+# Flux ranges include their start, so cursors are advanced by one tick
+cursor_step = timedelta(microseconds=1)
+
+rollup_retentions = {
+    "1m": config.ROLLUP_RETENTION_1M,
+    "1h": config.ROLLUP_RETENTION_1H,
+}
+
+
+def get_bucket_width(start_date, end_date, max_points):
+    # Seconds per bucket so that the range yields at most `max_points` rows
+    duration = (
+        pd.Timestamp(end_date.strip()) - pd.Timestamp(start_date.strip())
+    ).total_seconds()
+    return max(duration, 1e-3) / max(int(max_points), 1)
+
+
+def get_microseconds(value):
+    # Integer microseconds since the epoch, so bucket edges are exact
+    return (pd.Timestamp(value.strip()) - pd.Timestamp(0)) // pd.Timedelta(
+        microseconds=1
+    )
+
+
+class Storage(ABC):
+    @abstractmethod
+    def writer(self, sensor_id, columns, retention, batch_size=None):
+        pass
+
+    @abstractmethod
+    def read_range(
+        self,
+        sensor_id,
+        columns,
+        start_date,
+        end_date,
+        max_points=None,
+        aggregate="mean",
+        since=None,
+    ):
+        pass
+
+    @abstractmethod
+    def read_latest(self, sensor_id, columns, limit, since=None):
+        pass
+
+    @abstractmethod
+    def export(self, sensor_id, columns, start_date, end_date, chunksize):
+        pass
+
+    @abstractmethod
+    def drop(self, sensor_id):
+        pass
+
+
+class SQLiteStorage(Storage):
+    def __init__(self, engine):
+        self.engine = engine
+
+    def writer(self, sensor_id, columns, retention, batch_size=None):
+        table = create_table(self.engine, sensor_id, columns)
+        rollups = [
+            Rollup(
+                get_table_name(sensor_id, resolution),
+                columns,
+                seconds,
+                rollup_retentions[resolution],
+            )
+            for resolution, seconds in resolutions.items()
+        ]
+        if batch_size is None:
+            batch_size = config.SENSOR_WRITE_BATCH
+
+        return Writer(self.engine, table.name, columns, retention, rollups, batch_size)
+
+    def read(self, sensor_id, columns, query, params, resolution=None, chunksize=None):
+        if not has_table(self.engine, sensor_id, resolution):
+            if chunksize is not None:
+                return iter(())
+            return pd.DataFrame(columns=columns)
+
+        return pd.read_sql(
+            query.format(
+                table=get_table_name(sensor_id, resolution),
+                columns=", ".join(["date_time"] + columns),
+            ),
+            con=self.engine,
+            params=params,
+            parse_dates=["date_time"],
+            index_col="date_time",
+            chunksize=chunksize,
+        )
+
+    def read_range(
+        self,
+        sensor_id,
+        columns,
+        start_date,
+        end_date,
+        max_points=None,
+        aggregate="mean",
+        since=None,
+    ):
+        width = None
+        if max_points is not None:
+            width = get_bucket_width(start_date, end_date, max_points)
+
+        # Rows at or before the cursor were already delivered
+        cursor = "" if since is None else since.strftime(date_format)
+
+        resolution = self.get_resolution(sensor_id, start_date, width)
+        if resolution is not None:
+            return self.read_rollup(
+                sensor_id,
+                columns,
+                resolution,
+                start_date,
+                end_date,
+                max(width or 0, resolutions[resolution]),
+                aggregate,
+                cursor,
+            )
+
+        if width is None:
+            query = """SELECT {columns} FROM {table} WHERE date_time BETWEEN ? AND ? AND date_time > ? ORDER BY date_time ASC"""
+            return self.read(sensor_id, columns, query, (start_date, end_date, cursor))
+
+        # One row per time bucket, aggregated by SQLite itself. strftime rounds
+        # fractional seconds to milliseconds, so it only gets the whole ones
+        function = aggregates[aggregate]
+        query = (
+            """SELECT MIN(date_time) AS date_time, """
+            + ", ".join(
+                "{}({}) AS {}".format(function, column, column) for column in columns
+            )
+            + """ FROM {table} WHERE date_time BETWEEN ? AND ? AND date_time > ? GROUP BY (strftime('%s', substr(date_time, 1, 19)) * 1000000 + CAST(substr(date_time, 21, 6) AS INTEGER) - ?) / ? ORDER BY date_time ASC"""
+        )
+        return self.read(
+            sensor_id,
+            columns,
+            query,
+            (
+                start_date,
+                end_date,
+                cursor,
+                get_microseconds(start_date),
+                max(1, math.ceil(width * 1e6)),
+            ),
+        )
+
+    def get_oldest(self, sensor_id, resolution=None):
+        if not has_table(self.engine, sensor_id, resolution):
+            return None
+
+        column = "date_time" if resolution is None else "bucket"
+        query = text(
+            "SELECT MIN({}) FROM {}".format(
+                column, get_table_name(sensor_id, resolution)
+            )
+        )
+        with self.engine.connect() as conn:
+            oldest = conn.execute(query).scalar()
+
+        return None if oldest is None else pd.Timestamp(oldest)
+
+    def get_resolution(self, sensor_id, start_date, width):
+        ordered = sorted(resolutions, key=resolutions.get)
+
+        # Coarsest rollup that is still no coarser than the requested buckets
+        resolution = None
+        for name in ordered:
+            if width is not None and resolutions[name] <= width:
+                resolution = name
+
+        # The coarsest rollup is kept longest, so its first bucket is where the
+        # sensor's history begins; finer sources that were trimmed after that
+        # no longer cover the range and are skipped
+        origin = self.get_oldest(sensor_id, ordered[-1])
+        if origin is None:
+            return resolution
+
+        requested = pd.Timestamp(start_date.strip())
+        start = max(requested, origin)
+        candidates = [None] + ordered
+        for name in candidates[candidates.index(resolution) :]:
+            oldest = self.get_oldest(sensor_id, name)
+            if oldest is None:
+                continue
+
+            # A source covers the range when its first row falls within one
+            # of its own buckets of the start. Before the origin, the history
+            # begins somewhere inside the origin's floored bucket
+            seconds = 0 if name is None else resolutions[name]
+            if requested <= origin:
+                seconds = resolutions[ordered[-1]]
+            if oldest <= start + pd.Timedelta(seconds=seconds):
+                return name
+
+        return ordered[-1]
+
+    def read_rollup(
+        self,
+        sensor_id,
+        columns,
+        resolution,
+        start_date,
+        end_date,
+        width,
+        aggregate,
+        cursor="",
+    ):
+        function = rollup_aggregates[aggregate]
+        query = (
+            """SELECT MIN(bucket) AS date_time, """
+            + ", ".join(
+                "{} AS {}".format(function.format(column), column) for column in columns
+            )
+            + """ FROM {table} WHERE bucket BETWEEN ? AND ? AND bucket > ? GROUP BY (strftime('%s', bucket) * 1000000 - ?) / ? ORDER BY date_time ASC"""
+        )
+        return self.read(
+            sensor_id,
+            columns,
+            query,
+            (
+                start_date,
+                end_date,
+                cursor,
+                get_microseconds(start_date),
+                max(1, math.ceil(width * 1e6)),
+            ),
+            resolution,
+        )
+
+    def read_latest(self, sensor_id, columns, limit, since=None):
+        # Stored timestamps share one fixed-width format, so the cursor
+        # compares as a string and the date_time index serves the range
+        limit = -1 if limit is None else limit
+        if since is not None:
+            # The next rows after the cursor, so that paging skips none
+            query = """SELECT {columns} FROM {table} WHERE date_time > ? ORDER BY date_time ASC LIMIT ?"""
+            return self.read(
+                sensor_id, columns, query, (since.strftime(date_format), limit)
+            )
+
+        query = """SELECT * FROM (SELECT {columns} FROM {table} ORDER BY date_time DESC LIMIT ?) AS recent_records ORDER BY date_time ASC"""
+        return self.read(sensor_id, columns, query, (limit,))
+
+    def export(self, sensor_id, columns, start_date, end_date, chunksize):
+        # read_sql pulls `chunksize` rows at a time off a single cursor
+        query = """SELECT {columns} FROM {table} WHERE date_time BETWEEN ? AND ? ORDER BY date_time ASC"""
+        return self.read(
+            sensor_id, columns, query, (start_date, end_date), chunksize=chunksize
+        )
+
+    def drop(self, sensor_id):
+        drop_table(self.engine, sensor_id)
+
+
+class InfluxDBWriter:
+    def __init__(self, write_api, bucket, sensor_id, columns):
+        self.write_api = write_api
+        self.bucket = bucket
+        self.tags = "data,sensor_id={}".format(sensor_id)
+        self.columns = columns
+
+    def write(self, date_time, values):
+        fields = ",".join(
+            "{}={!r}".format(column, value)
+            for column, value in zip(self.columns, values.tolist())
+            if value == value
+        )
+        if fields == "":
+            return
+
+        # Naive timestamps are local time, as produced by the receive stage
+        timestamp = int(date_time.astimezone().timestamp() * 1e6) * 1000
+        self.write_api.write(
+            bucket=self.bucket,
+            record="{} {} {}".format(self.tags, fields, timestamp),
+        )
+
+    def replace(self, times, values):
+        # Points with the same series and timestamp overwrite each other, so
+        # writing the range again is already idempotent
+        for date_time, row in zip(times, values):
+            self.write(date_time, row)
+
+    def timeout(self):
+        # The client batches and flushes on its own background thread
+        return None
+
+    def flush(self):
+        self.write_api.flush()
+
+
+class InfluxDBStorage(Storage):
+    def __init__(self, url, token, org, bucket):
+        from influxdb_client import InfluxDBClient, WriteOptions
+
+        self.client = InfluxDBClient(url=url, token=token, org=org)
+        self.write_api = self.client.write_api(
+            write_options=WriteOptions(
+                batch_size=config.SENSOR_WRITE_BATCH,
+                flush_interval=int(config.SENSOR_WRITE_INTERVAL * 1000),
+            )
+        )
+        self.query_api = self.client.query_api()
+        self.org = org
+        self.bucket = bucket
+
+    def writer(self, sensor_id, columns, retention, batch_size=None):
+        # Retention is the bucket's retention policy on InfluxDB, and the
+        # client batches on its own
+        return InfluxDBWriter(self.write_api, self.bucket, sensor_id, columns)
+
+    def get_query(
+        self, sensor_id, start, stop, tail, window=None, aggregate=None, head=None
+    ):
+        query = f"""from(bucket: "{self.bucket}")
+  |> range(start: {start}, stop: {stop})
+  |> filter(fn: (r) => r._measurement == "data" and r.sensor_id == "{sensor_id}")"""
+        if window is not None:
+            query += "\n  |> aggregateWindow(every: {}ms, fn: {}, createEmpty: false)".format(
+                max(1, int(window * 1000)), aggregate
+            )
+        query += """
+  |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+  |> group()
+  |> sort(columns: ["_time"])"""
+        if tail is not None:
+            query += "\n  |> tail(n: {})".format(int(tail))
+        if head is not None:
+            query += "\n  |> limit(n: {})".format(int(head))
+
+        return query
+
+    def get_frame(self, result, columns):
+        if result.empty:
+            return pd.DataFrame(columns=columns)
+
+        date_time = pd.to_datetime(result["_time"]).dt.tz_convert(
+            datetime.now().astimezone().tzinfo
+        )
+        result = result.reindex(columns=columns)
+        result.index = pd.DatetimeIndex(
+            date_time.dt.tz_localize(None), name="date_time"
+        )
+
+        return result
+
+    def read(
+        self,
+        sensor_id,
+        columns,
+        start,
+        stop,
+        tail,
+        window=None,
+        aggregate=None,
+        head=None,
+    ):
+        query = self.get_query(sensor_id, start, stop, tail, window, aggregate, head)
+
+        result = self.query_api.query_data_frame(query, org=self.org)
+        if isinstance(result, list):
+            result = pd.concat(result) if len(result) > 0 else pd.DataFrame()
+
+        return self.get_frame(result, columns)
+
+    def read_range(
+        self,
+        sensor_id,
+        columns,
+        start_date,
+        end_date,
+        max_points=None,
+        aggregate="mean",
+        since=None,
+    ):
+        start = datetime.fromisoformat(start_date.strip())
+        if since is not None:
+            start = max(start, since + cursor_step)
+        start = start.astimezone().isoformat()
+        stop = datetime.fromisoformat(end_date.strip()).astimezone().isoformat()
+
+        window = None
+        if max_points is not None:
+            window = get_bucket_width(start_date, end_date, max_points)
+
+        return self.read(sensor_id, columns, start, stop, None, window, aggregate)
+
+    def read_latest(self, sensor_id, columns, limit, since=None):
+        if since is not None:
+            # The next rows after the cursor, so that paging skips none
+            start = (since + cursor_step).astimezone().isoformat()
+            return self.read(sensor_id, columns, start, "now()", None, head=limit)
+
+        return self.read(sensor_id, columns, 0, "now()", limit)
+
+    def export(self, sensor_id, columns, start_date, end_date, chunksize):
+        start = datetime.fromisoformat(start_date.strip()).astimezone().isoformat()
+        stop = datetime.fromisoformat(end_date.strip()).astimezone().isoformat()
+        query = self.get_query(sensor_id, start, stop, None)
+
+        # Records are parsed off the HTTP response one at a time
+        rows = []
+        for record in self.query_api.query_stream(query, org=self.org):
+            rows.append(record.values)
+            if len(rows) >= chunksize:
+                yield self.get_frame(pd.DataFrame(rows), columns)
+                rows = []
+        if len(rows) > 0:
+            yield self.get_frame(pd.DataFrame(rows), columns)
+
+    def drop(self, sensor_id):
+        self.client.delete_api().delete(
+            "1970-01-01T00:00:00Z",
+            datetime.now().astimezone().isoformat(),
+            '_measurement="data" AND sensor_id="{}"'.format(sensor_id),
+            bucket=self.bucket,
+            org=self.org,
+        )
+
+
+def get_storage():
+    if config.STORAGE_BACKEND == "influxdb":
+        return InfluxDBStorage(
+            config.INFLUXDB_URL,
+            config.INFLUXDB_TOKEN,
+            config.INFLUXDB_ORG,
+            config.INFLUXDB_BUCKET,
+        )
+
+    return SQLiteStorage(engine)
+
+
+storage = get_storage()
@@ -0,0 +1,217 @@
+import sys
+import time
+import threading
+import multiprocessing
+
+from src.config import SENSOR_QUEUE_SIZE, SENSOR_RESTART_BACKOFF
+from src.utils.broadcast import Broadcaster
+from src.utils.buffer import History
+from src.utils.channel import EOS
+from src.utils.runtime import get_signals
+
+
+# Fresh interpreters, so no torch, SQLite or lock state leaks in through fork
+context = multiprocessing.get_context("spawn")
+
+
+def run_worker(sensor_id, commands, samples):
+    import torch
+
+    from src import app
+    from src.models.sensor_model import Sensor
+    from src.models.signal_model import Signal
+    from src.utils.runtime import Pipeline
+
+    # One process per sensor already spreads the load over the cores
+    torch.set_num_threads(1)
+
+    lock = threading.Lock()
+
+    def send(message):
+        with lock:
+            samples.send(message)
+
+    def forward(channel):
+        while True:
+            record = channel.get()
+            if record is EOS:
+                break
+            send(("record",) + tuple(record))
+
+    with app.app_context():
+        sensor = Sensor.query.get(sensor_id)
+        pipeline = Pipeline(sensor, Signal)
+        forwarder = threading.Thread(
+            target=forward,
+            args=(pipeline.broadcaster.subscribe(),),
+            name="sensor-{}-forward".format(sensor_id),
+            daemon=True,
+        )
+        forwarder.start()
+        pipeline.start()
+
+        timeout = sensor.sampling_period + 1
+        while True:
+            try:
+                if not commands.poll(1.0):
+                    if not all(thread.is_alive() for thread in pipeline.threads):
+                        # A stage died; exit non-zero so the supervisor restarts us
+                        pipeline.stop(timeout)
+                        sys.exit(1)
+                    continue
+                command = commands.recv()
+            except EOFError:
+                # The API process is gone
+                command = ("stop",)
+
+            if command[0] == "setpoint":
+                pipeline.setpoints.set(command[1], command[2])
+            elif command[0] == "stats":
+                send(("stats", pipeline.stats()))
+            elif command[0] == "stop":
+                pipeline.stop(timeout)
+                forwarder.join(timeout)
+                break
+
+
+class RemoteSetpoints:
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+
+    def set(self, signal_id, value):
+        self.pipeline.send(("setpoint", signal_id, value))
+
+
+class ProcessPipeline:
+    def __init__(self, sensor, Signal):
+        self.sensor_id = sensor.id
+        self.timeout = sensor.sampling_period + 1
+        signals = (
+            Signal.query.filter_by(sensor_id=sensor.id).order_by(Signal.id.asc()).all()
+        )
+        columns, _, _ = sensor.get_fields(signals)
+        self.signals = get_signals(signals)
+        self.setpoints = RemoteSetpoints(self)
+        self.history = History(sensor.buffer, columns)
+        self.broadcaster = Broadcaster(SENSOR_QUEUE_SIZE)
+        self.kill_event = threading.Event()
+        self.lock = threading.Lock()
+        self.process = None
+        self.commands = None
+        self.samples = None
+        self.restarts = 0
+        self.failures = 0
+        self.spawned = None
+        self.remote = {}
+        self.stats_event = threading.Event()
+        self.thread = None
+
+    def spawn(self):
+        commands, self.commands = context.Pipe(duplex=False)
+        self.samples, samples = context.Pipe(duplex=False)
+        self.process = context.Process(
+            target=run_worker,
+            args=(self.sensor_id, commands, samples),
+            name="sensor-{}".format(self.sensor_id),
+            daemon=True,
+        )
+        self.process.start()
+        self.spawned = time.monotonic()
+        # Keep only the parent's ends open, so EOF reaches both sides
+        commands.close()
+        samples.close()
+
+    def send(self, message):
+        with self.lock:
+            if self.commands is None:
+                return
+            try:
+                self.commands.send(message)
+            except OSError:
+                # The worker is being restarted; it re-reads the database
+                pass
+
+    def receive(self, timeout):
+        try:
+            if not self.samples.poll(timeout):
+                return
+            while True:
+                message = self.samples.recv()
+                if message[0] == "record":
+                    self.history.push(message[1], message[2])
+                    self.broadcaster.publish(message[1:])
+                elif message[0] == "stats":
+                    self.remote = message[1]
+                    self.stats_event.set()
+                if not self.samples.poll():
+                    break
+        except (EOFError, OSError):
+            self.process.join(self.timeout)
+
+    def supervise(self):
+        try:
+            self.spawn()
+            while not self.kill_event.is_set():
+                self.receive(0.5)
+                if self.process.is_alive():
+                    continue
+
+                # Crashed: back off exponentially, then start a fresh worker.
+                # A worker that ran longer than the longest delay starts over
+                if time.monotonic() - self.spawned > SENSOR_RESTART_BACKOFF:
+                    self.failures = 0
+                self.restarts += 1
+                self.failures += 1
+                delay = min(2 ** (self.failures - 1), SENSOR_RESTART_BACKOFF)
+                print(
+                    "Sensor {} worker exited with code {}, restarting in {}s...".format(
+                        self.sensor_id, self.process.exitcode, delay
+                    )
+                )
+                if self.kill_event.wait(delay):
+                    break
+                with self.lock:
+                    self.spawn()
+        finally:
+            if self.process is not None:
+                self.send(("stop",))
+                self.process.join(self.timeout)
+                if self.process.is_alive():
+                    self.process.terminate()
+                self.samples.close()
+                with self.lock:
+                    self.commands.close()
+                    self.commands = None
+            self.broadcaster.close()
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.supervise,
+            name="sensor-{}-supervisor".format(self.sensor_id),
+            daemon=True,
+        )
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        # The supervisor still stops (or terminates) the worker after the
+        # timeout; callers only bound how long they wait for it
+        self.kill_event.set()
+        self.thread.join(timeout)
+
+    def stats(self):
+        self.stats_event.clear()
+        self.send(("stats",))
+        self.stats_event.wait(1.0)
+
+        stats = dict(self.remote)
+        stats["history"] = len(self.history)
+        stats["subscribers"] = len(self.broadcaster)
+        stats["process"] = {
+            "pid": None if self.process is None else self.process.pid,
+            "restarts": self.restarts,
+        }
+
+        return stats
+
+    def is_alive(self):
+        return self.thread is not None and self.thread.is_alive()
@@ -0,0 +1,333 @@
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from src.config import SENSOR_WRITE_BATCH, SENSOR_WRITE_INTERVAL
+
+
+date_format = "%Y-%m-%d %H:%M:%S.%f"
+epoch = datetime(1970, 1, 1)
+
+
+class Rollup:
+    def __init__(self, table, columns, seconds, retention):
+        self.columns = columns
+        self.seconds = seconds
+        self.retention = timedelta(seconds=retention)
+
+        fields = ["count"] + [
+            "{}_{}".format(column, aggregate)
+            for column in columns
+            for aggregate in ("sum", "min", "max")
+        ]
+        updates = ["count = count + excluded.count"]
+        for column in columns:
+            updates += [
+                "{0}_sum = {0}_sum + excluded.{0}_sum".format(column),
+                "{0}_min = MIN(COALESCE({0}_min, excluded.{0}_min), COALESCE(excluded.{0}_min, {0}_min))".format(
+                    column
+                ),
+                "{0}_max = MAX(COALESCE({0}_max, excluded.{0}_max), COALESCE(excluded.{0}_max, {0}_max))".format(
+                    column
+                ),
+            ]
+
+        self.upsert = text(
+            "INSERT INTO {} (bucket, {}) VALUES (:bucket, {}) ON CONFLICT (bucket) DO UPDATE SET {}".format(
+                table,
+                ", ".join(fields),
+                ", ".join(":{}".format(field) for field in fields),
+                ", ".join(updates),
+            )
+        )
+        self.trim = text("DELETE FROM {} WHERE bucket < :cutoff".format(table))
+        self.delete = text(
+            "DELETE FROM {} WHERE bucket BETWEEN :start AND :end".format(table)
+        )
+        self.select = text(
+            "SELECT bucket, {} FROM {} WHERE bucket = :bucket".format(
+                ", ".join(fields), table
+            )
+        )
+
+    def floor(self, date_time):
+        seconds = (date_time - epoch).total_seconds()
+        return epoch + timedelta(seconds=seconds // self.seconds * self.seconds)
+
+    def aggregate(self, times, values):
+        buckets = {}
+        for date_time, row in zip(times, values):
+            buckets.setdefault(self.floor(date_time), []).append(row)
+
+        rows = []
+        for bucket, group in buckets.items():
+            group = np.vstack(group)
+            row = {"bucket": bucket.strftime(date_format), "count": len(group)}
+            for column, total, low, high in zip(
+                self.columns,
+                np.nansum(group, axis=0).tolist(),
+                np.nanmin(group, axis=0).tolist(),
+                np.nanmax(group, axis=0).tolist(),
+            ):
+                row["{}_sum".format(column)] = total
+                row["{}_min".format(column)] = low
+                row["{}_max".format(column)] = high
+            rows.append(row)
+
+        return rows
+
+    def merge(self, old, removed, added, kept):
+        # The stored bucket with the `removed` rows taken out and the `added`
+        # ones put in, each given as aggregate() rows. Counts and sums are
+        # exact; an extreme that a removed row may have held is recomputed
+        # from the `kept` rows still stored, as the trimmed ones are unknown
+        removed = removed[0] if len(removed) > 0 else None
+        kept = kept[0] if len(kept) > 0 else None
+
+        row = {"bucket": old["bucket"]}
+        row["count"] = (
+            old["count"] - get_field(removed, "count", 0) + get_field(added, "count", 0)
+        )
+        for column in self.columns:
+            field = "{}_sum".format(column)
+            row[field] = (
+                get_field(old, field, 0)
+                - get_field(removed, field, 0)
+                + get_field(added, field, 0)
+            )
+            for aggregate, function in (("min", min), ("max", max)):
+                field = "{}_{}".format(column, aggregate)
+                stored = get_field(old, field)
+                if stored is not None and stored == get_field(removed, field):
+                    stored = get_field(kept, field)
+                values = [
+                    value
+                    for value in (stored, get_field(added, field))
+                    if value is not None
+                ]
+                row[field] = function(values) if len(values) > 0 else None
+
+        return row
+
+
+def get_field(row, field, default=None):
+    # NULL and NaN both mean that no row had a value
+    value = None if row is None else row.get(field)
+    if value is None or value != value:
+        return default
+
+    return value
+
+
+class Writer:
+    def __init__(
+        self,
+        engine,
+        table,
+        columns,
+        retention,
+        rollups=(),
+        batch_size=SENSOR_WRITE_BATCH,
+        interval=SENSOR_WRITE_INTERVAL,
+    ):
+        self.engine = engine
+        self.columns = columns
+        self.retention = timedelta(seconds=retention)
+        self.rollups = rollups
+        self.batch_size = batch_size
+        self.interval = interval
+        self.rows = []
+        self.times = []
+        self.values = []
+        self.since = None
+        self.last = None
+        self.failed = False
+
+        self.insert = text(
+            "INSERT INTO {} (date_time, {}) VALUES (:date_time, {})".format(
+                table,
+                ", ".join(columns),
+                ", ".join(":{}".format(column) for column in columns),
+            )
+        )
+        # Range delete on the date_time index, instead of sorting the table
+        self.trim = text("DELETE FROM {} WHERE date_time < :cutoff".format(table))
+        self.delete = text(
+            "DELETE FROM {} WHERE date_time BETWEEN :start AND :end".format(table)
+        )
+        self.select = text(
+            "SELECT date_time, {} FROM {} WHERE date_time >= :start AND date_time < :end".format(
+                ", ".join(columns), table
+            )
+        )
+        self.oldest = text("SELECT MIN(date_time) FROM {}".format(table))
+
+    def get_row(self, date_time, values):
+        row = dict(zip(self.columns, values.tolist()))
+        row["date_time"] = date_time.strftime(date_format)
+        return row
+
+    def write(self, date_time, values):
+        self.rows.append(self.get_row(date_time, values))
+        self.times.append(date_time)
+        self.values.append(values)
+        self.last = date_time
+
+        if self.since is None:
+            self.since = time.monotonic()
+
+        # After a failed flush, retry once per interval rather than per row
+        full = len(self.rows) >= self.batch_size and not self.failed
+        if full or self.timeout() == 0:
+            self.flush()
+
+    def timeout(self):
+        # Seconds until the pending rows are due, None when nothing is pending
+        if self.since is None:
+            return None
+
+        return max(0.0, self.interval - (time.monotonic() - self.since))
+
+    def flush(self):
+        if len(self.rows) == 0:
+            return
+
+        cutoff = (self.last - self.retention).strftime(date_format)
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(self.insert, self.rows)
+                conn.execute(self.trim, {"cutoff": cutoff})
+
+                for rollup in self.rollups:
+                    conn.execute(
+                        rollup.upsert, rollup.aggregate(self.times, self.values)
+                    )
+                    cutoff = (self.last - rollup.retention).strftime(date_format)
+                    conn.execute(rollup.trim, {"cutoff": cutoff})
+        except Exception as err:
+            # The transaction rolled back (e.g. SQLite busy past busy_timeout),
+            # so the rows are kept for the next flush. Rows that fell out of
+            # retention meanwhile would be trimmed anyway
+            print("Could not write {} rows, retrying: {!r}".format(len(self.rows), err))
+            self.keep(self.last - self.retention)
+            self.since = time.monotonic()
+            self.failed = True
+            return
+
+        self.rows = []
+        self.times = []
+        self.values = []
+        self.since = None
+        self.failed = False
+
+    def keep(self, cutoff):
+        start = 0
+        while start < len(self.times) and self.times[start] < cutoff:
+            start += 1
+
+        self.rows = self.rows[start:]
+        self.times = self.times[start:]
+        self.values = self.values[start:]
+
+    def replace(self, times, values):
+        # Overwrites the range [times[0], times[-1]], so replaying it again
+        # leaves the same rows and rollups behind. Nothing is trimmed: replayed
+        # timestamps say nothing about what the live retention should keep
+        first = times[0].strftime(date_format)
+        last = times[-1].strftime(date_format)
+
+        with self.engine.begin() as conn:
+            # Trimming removes the oldest rows, so every row from here on is
+            # still stored
+            oldest = conn.execute(self.oldest).scalar()
+            edges = {
+                rollup: [
+                    self.get_edge(conn, rollup, bucket, first, last, oldest)
+                    for bucket in {rollup.floor(times[0]), rollup.floor(times[-1])}
+                ]
+                for rollup in self.rollups
+            }
+
+            conn.execute(self.delete, {"start": first, "end": last})
+            conn.execute(
+                self.insert,
+                [self.get_row(date_time, row) for date_time, row in zip(times, values)],
+            )
+
+            for rollup in self.rollups:
+                kept_times = []
+                kept_values = []
+                merges = []
+                for edge in edges[rollup]:
+                    if edge is None:
+                        continue
+                    kept, old, removed = edge
+                    if old is None:
+                        # Every row of the bucket is stored, so it is rebuilt
+                        # from the replayed rows and the stored ones around them
+                        kept_times += kept[0]
+                        kept_values += kept[1]
+                    else:
+                        merges.append(edge)
+
+                rows = {
+                    row["bucket"]: row
+                    for row in rollup.aggregate(
+                        list(times) + kept_times, list(values) + kept_values
+                    )
+                }
+                for kept, old, removed in merges:
+                    rows[old["bucket"]] = rollup.merge(
+                        old,
+                        rollup.aggregate(*removed),
+                        rows.get(old["bucket"]),
+                        rollup.aggregate(*kept),
+                    )
+
+                conn.execute(
+                    rollup.delete,
+                    {
+                        "start": rollup.floor(times[0]).strftime(date_format),
+                        "end": rollup.floor(times[-1]).strftime(date_format),
+                    },
+                )
+                conn.execute(rollup.upsert, list(rows.values()))
+
+    def get_edge(self, conn, rollup, bucket, first, last, oldest):
+        # None for a bucket inside the replayed range, whose rows are all
+        # replaced. Otherwise the stored rows outside the range, the stored
+        # bucket when some of its rows were trimmed, and the rows replaced
+        start = bucket.strftime(date_format)
+        end = bucket + timedelta(seconds=rollup.seconds)
+        if first <= start and end - timedelta(microseconds=1) <= pd.Timestamp(last):
+            return None
+
+        kept = ([], [])
+        removed = ([], [])
+        for row in conn.execute(
+            self.select, {"start": start, "end": end.strftime(date_format)}
+        ):
+            date_time = pd.Timestamp(row[0])
+            replaced = (
+                removed if first <= date_time.strftime(date_format) <= last else kept
+            )
+            replaced[0].append(date_time)
+            replaced[1].append(np.array(row[1:], dtype=np.float64))
+
+        old = conn.execute(rollup.select, {"bucket": start}).mappings().first()
+        if old is None or old["count"] == len(kept[0]) + len(removed[0]):
+            return kept, None, removed
+
+        # Some of the bucket's rows were trimmed. When they all precede the
+        # range, the rows it replaces are stored and can be taken out
+        if oldest is None or oldest > first:
+            raise ValueError(
+                "Rows before {} were trimmed, so the {} s rollup at {} cannot be rebuilt.".format(
+                    oldest, rollup.seconds, start
+                )
+            )
+
+        return kept, dict(old), removed
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The API package is imported as `src`, as run.py does from backend/api
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "api"))
+)
+os.environ.setdefault("SQLALCHEMY_DATABASE_URI", "sqlite://")
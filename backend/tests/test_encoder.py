@@ -0,0 +1,34 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+
+from src.utils.encoder import get_columns, get_time
+
+
+def test_columns_keep_subsecond_times():
+    # Four samples at 10 Hz
+    times = np.datetime64("2026-01-01T10:00:09") + np.arange(4) * np.timedelta64(
+        100, "ms"
+    )
+    values = np.array([[1.0], [2.0], [3.0], [4.0]])
+    signal = SimpleNamespace(id=1, description="")
+
+    data = get_columns(times, values, [signal], ["signal"], sep=" ")
+
+    assert data["date_time"] == [
+        "2026-01-01 10:00:09.000",
+        "2026-01-01 10:00:09.100",
+        "2026-01-01 10:00:09.200",
+        "2026-01-01 10:00:09.300",
+    ]
+    assert data["values"][0]["value"].tolist() == [1.0, 2.0, 3.0, 4.0]
+
+
+def test_time_matches_columns():
+    # Stream events line up with the points the chart was seeded with
+    date_time = datetime(2026, 1, 1, 10, 2, 53, 500000)
+    data = get_columns(np.array([np.datetime64(date_time)]), np.zeros((1, 0)), [], [])
+
+    assert get_time(date_time) == "2026-01-01T10:02:53.500"
+    assert data["date_time"] == [get_time(date_time)]
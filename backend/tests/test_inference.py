@@ -0,0 +1,206 @@
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import torch
+
+from src.models import sensor_model
+from src.models.sensor_model import Sensor
+from src.utils.channel import Channel
+from src.utils.inference import Scheduler, step
+from src.utils.metrics import Metrics
+from src.utils.replay import Replay
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), "models", "repeater_5x2.pt")
+
+# The model deployed sensors run, with its fitted scalers
+SHIPPED_PATH = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "database",
+    "53fc2fad-1109-4882-9553-516721ce7edf.pt",
+)
+
+TOLERANCE = 1e-5
+
+# Stream against window outputs, in scaled units where an output's fitted
+# range spans 2: within the first `lag` ticks, the next `lag`, and after
+WINDOW_BOUNDS = (0.05, 0.025, 0.005)
+
+
+@pytest.fixture(scope="module")
+def repeater():
+    return torch.jit.load(MODEL_PATH, map_location="cpu").eval()
+
+
+def get_window(repeater, length, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    y_size = repeater.output_size
+    x_size = repeater.lstm.input_size - y_size
+    x = torch.rand(1, length, x_size, generator=generator) * 2 - 1
+    y = torch.rand(1, length, y_size, generator=generator) * 2 - 1
+
+    return x, y
+
+
+def get_state(repeater):
+    h = torch.zeros(repeater.num_layers, 1, repeater.hidden_size)
+    c = torch.zeros(repeater.num_layers, 1, repeater.hidden_size)
+
+    return h, c
+
+
+class Fitted:
+    # This export has no fitted scalers, so made-up ones stand in; anything
+    # else comes from the model, or from `modules` when given
+    def __init__(self, repeater, **modules):
+        self.repeater = repeater
+        y_size = repeater.output_size
+        x_size = repeater.lstm.input_size - y_size
+        self.x_min_ = np.linspace(-0.5, 0.5, x_size)
+        self.x_scale_ = np.linspace(0.5, 2.0, x_size)
+        self.y_min_ = np.linspace(-1.0, 1.0, y_size)
+        self.y_scale_ = np.linspace(0.1, 0.2, y_size)
+        self.__dict__.update(modules)
+
+    def __getattr__(self, name):
+        return getattr(self.repeater, name)
+
+
+def get_setpoints(model, length, seed=0, hold=4):
+    # Setpoints within the fitted input range, each held for `hold` ticks
+    x_min = np.atleast_1d(np.asarray(model.x_min_, dtype=np.float64))
+    x_scale = np.atleast_1d(np.asarray(model.x_scale_, dtype=np.float64))
+    generator = np.random.default_rng(seed)
+    scaled = generator.uniform(-1, 1, (length // hold + 1, len(x_min)))
+
+    return ((np.repeat(scaled, hold, axis=0) - x_min) / x_scale)[:length]
+
+
+def run_sensor(model, x, mode, monkeypatch):
+    # Sensor.infer over `x`, one record per tick, through a real scheduler
+    monkeypatch.setattr(sensor_model, "SENSOR_INFERENCE", mode)
+    output_size = len(np.atleast_1d(np.asarray(model.y_min_)))
+    sensor = Sensor("test", "", 1, x.shape[1], output_size, len(x), "test")
+    input_queue = Channel(len(x) + 1)
+    output_queue = Channel(len(x) + 1)
+    for tick, row in enumerate(x):
+        input_queue.put((tick, row))
+    input_queue.close()
+
+    scheduler = Scheduler("test", model)
+    try:
+        sensor.infer(scheduler, input_queue, output_queue, Metrics())
+    finally:
+        scheduler.close()
+
+    return np.array([output_queue.get()[1][x.shape[1] :] for _ in range(len(x))])
+
+
+def test_model_predates_step(repeater):
+    # This export only scripts `forward`, so `step` goes through the fallback
+    assert not hasattr(repeater, "step")
+    assert hasattr(repeater.lstm, "forward__0")
+
+
+def test_step_matches_forward(repeater):
+    x, y = get_window(repeater, repeater.lag)
+
+    with torch.inference_mode():
+        z_window = repeater.forward(x, y)
+
+        # Warm-start on all but the newest row, as Sensor.process does
+        h, c = get_state(repeater)
+        _, h, c = step(repeater, x[:, :-1], y[:, :-1], h, c)
+        z_step, _, _ = step(repeater, x[:, -1:], y[:, -1:], h, c)
+
+    assert z_step.shape == (1, 1, repeater.output_size)
+    assert torch.allclose(z_step[:, -1], z_window[:, -1], atol=TOLERANCE)
+
+
+def test_step_per_sample_matches_forward(repeater):
+    x, y = get_window(repeater, 4 * repeater.lag, seed=1)
+
+    with torch.inference_mode():
+        z_window = repeater.forward(x, y)
+
+        h, c = get_state(repeater)
+        z_step = []
+        for i in range(x.shape[1]):
+            z, h, c = step(repeater, x[:, i : i + 1], y[:, i : i + 1], h, c)
+            z_step.append(z)
+        z_step = torch.cat(z_step, dim=1)
+
+    assert torch.allclose(z_step, z_window, atol=TOLERANCE)
+
+
+def test_step_without_overloads(repeater):
+    # An eager LSTM has no `forward__0`, so `step` calls the module itself
+    lstm = torch.nn.LSTM(
+        input_size=repeater.lstm.input_size,
+        hidden_size=repeater.hidden_size,
+        num_layers=repeater.num_layers,
+        batch_first=True,
+    )
+    lstm.load_state_dict(repeater.lstm.state_dict())
+    eager = SimpleNamespace(lstm=lstm, linear=repeater.linear)
+
+    x, y = get_window(repeater, repeater.lag, seed=2)
+
+    with torch.inference_mode():
+        z_window = repeater.forward(x, y)
+        h, c = get_state(repeater)
+        z_step, h_step, c_step = step(eager, x, y, h, c)
+
+    assert torch.allclose(z_step, z_window, atol=TOLERANCE)
+    assert h_step.shape == h.shape
+    assert c_step.shape == c.shape
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_stream_close_to_window(seed, monkeypatch):
+    # The stream loop's state remembers past the `lag` rows that the window
+    # loop re-reads each tick, so the two drift apart before converging
+    shipped = torch.jit.load(SHIPPED_PATH, map_location="cpu").eval()
+    lag = shipped.lag
+    x = get_setpoints(shipped, 6 * lag, seed)
+
+    y_window = run_sensor(shipped, x, "window", monkeypatch)
+    y_stream = run_sensor(shipped, x, "stream", monkeypatch)
+
+    y_scale = np.asarray(shipped.y_scale_, dtype=np.float64)
+    error = (np.abs(y_stream - y_window) * y_scale).max(axis=1)
+    # The first tick sees the same history either way
+    assert error[0] < TOLERANCE
+    assert error[:lag].max() < WINDOW_BOUNDS[0]
+    assert error[lag : 2 * lag].max() < WINDOW_BOUNDS[1]
+    assert error[2 * lag :].max() < WINDOW_BOUNDS[2]
+
+
+@pytest.mark.parametrize("mode", ["stream", "window"])
+def test_replay_matches_sensor(repeater, mode, monkeypatch):
+    fitted = Fitted(repeater)
+    x = get_setpoints(fitted, 6 * repeater.lag)
+
+    replay = Replay(fitted, mode)
+    # NumPy only stands in for the stream loop
+    assert replay.unrolled == (mode == "stream")
+
+    y_replay = replay.run(x)
+    y_sensor = run_sensor(fitted, x, mode, monkeypatch)
+    assert np.abs((y_replay - y_sensor) * fitted.y_scale_).max() < TOLERANCE
+
+
+def test_replay_runs_other_models(repeater, monkeypatch):
+    # A head the unrolled LSTM knows nothing about
+    head = torch.nn.Sequential(repeater.linear, torch.nn.Tanh())
+    fitted = Fitted(repeater, linear=head)
+    x = get_setpoints(fitted, 4 * repeater.lag)
+
+    replay = Replay(fitted, "stream")
+    assert not replay.unrolled
+
+    y_replay = replay.run(x)
+    y_sensor = run_sensor(fitted, x, "stream", monkeypatch)
+    assert np.abs((y_replay - y_sensor) * fitted.y_scale_).max() < TOLERANCE
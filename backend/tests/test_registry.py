@@ -0,0 +1,40 @@
+import os
+import shutil
+
+from src.utils.inference import schedulers
+from src.utils.registry import Registry
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), "models", "repeater_5x2.pt")
+
+
+def test_copies_share_model(tmp_path):
+    copy = tmp_path / "copy.pt"
+    shutil.copyfile(MODEL_PATH, copy)
+    registry = Registry()
+
+    key, model = registry.acquire(MODEL_PATH)
+    copy_key, copy_model = registry.acquire(str(copy))
+
+    assert copy_key == key
+    assert copy_model is model
+    assert registry.stats() == [
+        {"path": os.path.realpath(MODEL_PATH), "sha256": key, "users": 2}
+    ]
+
+    registry.release(key)
+    registry.release(copy_key)
+    assert registry.stats()[0]["users"] == 0
+
+
+def test_copies_share_scheduler(tmp_path):
+    copy = tmp_path / "copy.pt"
+    shutil.copyfile(MODEL_PATH, copy)
+
+    scheduler = schedulers.acquire(MODEL_PATH)
+    try:
+        copy_scheduler = schedulers.acquire(str(copy))
+        assert copy_scheduler is scheduler
+        assert scheduler.users == 2
+        schedulers.release(copy_scheduler)
+    finally:
+        schedulers.release(scheduler)
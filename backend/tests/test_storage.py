@@ -0,0 +1,196 @@
+import gzip
+import http.server
+import threading
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import engine
+from src.utils.buffer import History
+from src.utils.storage import InfluxDBStorage, SQLiteStorage, Storage
+
+COLUMNS = ["signal_1", "signal_2"]
+
+START = datetime(2026, 1, 1, 10, 0, 0)
+
+
+class WriteHandler(http.server.BaseHTTPRequestHandler):
+    # Stands in for InfluxDB's /api/v2/write, recording every request
+    requests = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        url = urlparse(self.path)
+        self.requests.append((url.path, parse_qs(url.query), body.decode()))
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    WriteHandler.requests = []
+    server = http.server.HTTPServer(("127.0.0.1", 0), WriteHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_influxdb_writer(server):
+    url = "http://127.0.0.1:{}".format(server.server_address[1])
+    storage = InfluxDBStorage(url, "token", "sgr", "stem-sensor")
+    writer = storage.writer(7, ["signal_1", "signal_2"], 3600)
+
+    date_time = datetime(2026, 1, 1, 12, 0, 0, 250000)
+    writer.write(date_time, np.array([1.5, 2.0]))
+    writer.write(date_time + timedelta(seconds=1), np.array([np.nan, -3.25]))
+    writer.write(date_time + timedelta(seconds=2), np.array([np.nan, np.nan]))
+    # Closing the write API flushes the client's pending batch
+    storage.write_api.close()
+    storage.client.close()
+
+    assert len(WriteHandler.requests) > 0
+    lines = []
+    for path, query, body in WriteHandler.requests:
+        assert path == "/api/v2/write"
+        assert query["org"] == ["sgr"]
+        assert query["bucket"] == ["stem-sensor"]
+        assert query["precision"] == ["ns"]
+        lines += body.splitlines()
+
+    timestamp = int(date_time.astimezone().timestamp() * 1e6) * 1000
+    assert lines == [
+        "data,sensor_id=7 signal_1=1.5,signal_2=2.0 {}".format(timestamp),
+        # NaN fields are left out, and rows without any field are not sent
+        "data,sensor_id=7 signal_2=-3.25 {}".format(timestamp + 10**9),
+    ]
+
+
+@pytest.fixture
+def sqlite():
+    storage = SQLiteStorage(engine)
+    yield storage
+    storage.drop(1)
+
+
+def write_rows(writer, start, seconds, period=1.0):
+    times = [
+        start + timedelta(seconds=i * period) for i in range(round(seconds / period))
+    ]
+    for i, date_time in enumerate(times):
+        writer.write(date_time, np.array([float(i), -float(i)]))
+    writer.flush()
+
+    return times
+
+
+def test_read_range_skips_trimmed_raw(sqlite):
+    # Raw rows are kept for 5 min, the 1m rollup for all 2 h
+    writer = sqlite.writer(1, COLUMNS, 300)
+    write_rows(writer, START, 2 * 3600)
+
+    data = sqlite.read_range(1, COLUMNS, "2026-01-01 11:30:00", "2026-01-01 12:00:00")
+
+    # The whole half hour, from the rollup, not the last 5 min of raw rows
+    assert len(data) == 30
+    assert data.index[0] == pd.Timestamp("2026-01-01 11:30:00")
+    assert data.index[-1] == pd.Timestamp("2026-01-01 11:59:00")
+    assert data["signal_1"].iloc[0] == 5400 + 29.5
+
+
+def test_read_range_before_history(sqlite):
+    # History begins mid-bucket; a range starting before it still reads raw
+    writer = sqlite.writer(1, COLUMNS, 300)
+    write_rows(writer, START + timedelta(minutes=20), 120)
+
+    data = sqlite.read_range(1, COLUMNS, "2026-01-01 09:00:00", "2026-01-01 11:00:00")
+
+    assert len(data) == 120
+    assert data.index[0] == pd.Timestamp("2026-01-01 10:20:00")
+
+
+def test_read_range_bucket_edges(sqlite):
+    # 3 min in 5 buckets of 36 s; each bucket gets a row on its first
+    # microsecond and one on its last, both holding the bucket's index
+    writer = sqlite.writer(1, COLUMNS, 3600)
+    edges = [datetime(2026, 1, 1, 11, 30) + timedelta(seconds=36 * k) for k in range(6)]
+    for k in range(5):
+        writer.write(edges[k], np.array([float(k), 0.0]))
+        writer.write(
+            edges[k + 1] - timedelta(microseconds=1), np.array([float(k), 1.0])
+        )
+    writer.flush()
+
+    data = sqlite.read_range(
+        1, COLUMNS, "2026-01-01 11:30:00", "2026-01-01 11:33:00", max_points=5
+    )
+
+    assert data.index.tolist() == [pd.Timestamp(edge) for edge in edges[:5]]
+    assert data["signal_1"].tolist() == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert data["signal_2"].tolist() == [0.5] * 5
+
+
+def test_read_rollup_bucket_edges(sqlite):
+    # 10 min in 5 buckets of 120 s, served from the 1m rollup
+    writer = sqlite.writer(1, COLUMNS, 3600)
+    write_rows(writer, START, 600)
+
+    data = sqlite.read_range(
+        1, COLUMNS, "2026-01-01 10:00:00", "2026-01-01 10:09:59", max_points=5
+    )
+
+    assert data.index.tolist() == [
+        pd.Timestamp(START + timedelta(minutes=2 * k)) for k in range(5)
+    ]
+    assert data["signal_1"].tolist() == [59.5 + 120 * k for k in range(5)]
+
+
+def test_cursor_pages_ring_and_sqlite(sqlite):
+    # 25 rows at 10 Hz, paged 10 at a time from before the first one
+    writer = sqlite.writer(1, COLUMNS, 3600)
+    history = History(32, COLUMNS)
+    times = write_rows(writer, START, 2.5, period=0.1)
+    for i, date_time in enumerate(times):
+        history.push(date_time, np.array([float(i), -float(i)]))
+
+    def page_ring(limit, since):
+        return [pd.Timestamp(t) for t in history.latest(limit, COLUMNS, since)[0]]
+
+    def page_sqlite(limit, since):
+        return sqlite.read_latest(1, COLUMNS, limit, since).index.tolist()
+
+    for page in (page_ring, page_sqlite):
+        pages = []
+        cursor = START - timedelta(seconds=1)
+        while True:
+            rows = page(10, cursor)
+            if len(rows) == 0:
+                break
+            pages.append(rows)
+            cursor = rows[-1].to_pydatetime()
+
+        # Every row exactly once, oldest first
+        assert [len(rows) for rows in pages] == [10, 10, 5]
+        assert sum(pages, []) == [pd.Timestamp(t) for t in times]
+
+        # Without a cursor, the limit keeps the newest rows
+        assert page(10, None) == [pd.Timestamp(t) for t in times[-10:]]
+
+
+def test_storage_needs_every_method():
+    class Partial(Storage):
+        def writer(self, sensor_id, columns, retention, batch_size=None):
+            return None
+
+    # A backend missing methods fails when built, not on first use
+    with pytest.raises(TypeError):
+        Partial()
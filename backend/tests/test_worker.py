@@ -0,0 +1,22 @@
+import threading
+import time
+
+from src.utils.worker import ProcessPipeline
+
+
+def test_stop_waits_at_most_timeout():
+    # A supervisor still busy shutting its worker down
+    pipeline = ProcessPipeline.__new__(ProcessPipeline)
+    pipeline.kill_event = threading.Event()
+    release = threading.Event()
+    pipeline.thread = threading.Thread(target=release.wait, daemon=True)
+    pipeline.thread.start()
+
+    start = time.monotonic()
+    pipeline.stop(0.2)
+    elapsed = time.monotonic() - start
+
+    assert pipeline.kill_event.is_set()
+    assert 0.2 <= elapsed < 1.0
+    release.set()
+    pipeline.thread.join()
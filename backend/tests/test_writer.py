@@ -0,0 +1,159 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from sqlalchemy import text
+
+from src import engine
+from src.utils.storage import SQLiteStorage
+
+COLUMNS = ["signal_1", "signal_2"]
+
+START = datetime(2026, 1, 1, 10, 0, 0)
+
+
+@pytest.fixture
+def sqlite():
+    storage = SQLiteStorage(engine)
+    yield storage
+    storage.drop(1)
+
+
+def write_live(writer, seconds):
+    # One row per second from START, signal_1 counting up
+    for i in range(seconds):
+        writer.write(START + timedelta(seconds=i), np.array([float(i), -float(i)]))
+    writer.flush()
+
+
+def get_replay(start, end, value):
+    times = []
+    date_time = start
+    while date_time <= end:
+        times.append(date_time)
+        date_time += timedelta(seconds=1)
+
+    return times, [np.array([value, -value]) for _ in times]
+
+
+def get_bucket(table, bucket):
+    with engine.connect() as conn:
+        return (
+            conn.execute(
+                text(
+                    "SELECT count, signal_1_sum, signal_1_min, signal_1_max FROM {} WHERE bucket = :bucket".format(
+                        table
+                    )
+                ),
+                {"bucket": bucket.strftime("%Y-%m-%d %H:%M:%S.%f")},
+            )
+            .mappings()
+            .first()
+        )
+
+
+def test_replace_keeps_trimmed_history(sqlite):
+    # Raw rows are kept for 5 min, so most of the 11:00 hour is only rolled up
+    writer = sqlite.writer(1, COLUMNS, 300)
+    write_live(writer, 2 * 3600)
+
+    start = datetime(2026, 1, 1, 11, 57, 0)
+    end = datetime(2026, 1, 1, 11, 58, 29)
+    replaced = range(
+        int((start - START).total_seconds()), int((end - START).total_seconds()) + 1
+    )
+    for _ in range(2):
+        writer.replace(*get_replay(start, end, 1000.0))
+
+    hour = get_bucket("data_1_1h", datetime(2026, 1, 1, 11))
+    assert hour["count"] == 3600
+    assert hour["signal_1_sum"] == pytest.approx(
+        sum(range(3600, 7200)) - sum(replaced) + 1000.0 * len(replaced)
+    )
+    assert hour["signal_1_min"] == 1000.0
+    assert hour["signal_1_max"] == 7199.0
+
+    # Fully replaced, and rebuilt from the stored rows around the range
+    minute = get_bucket("data_1_1m", datetime(2026, 1, 1, 11, 57))
+    assert (minute["count"], minute["signal_1_sum"]) == (60, 60000.0)
+    minute = get_bucket("data_1_1m", datetime(2026, 1, 1, 11, 58))
+    assert minute["count"] == 60
+    assert minute["signal_1_sum"] == 30 * 1000.0 + sum(range(7110, 7140))
+    assert (minute["signal_1_min"], minute["signal_1_max"]) == (1000.0, 7139.0)
+
+
+def test_replace_recomputes_replaced_extreme(sqlite):
+    writer = sqlite.writer(1, COLUMNS, 300)
+    write_live(writer, 2 * 3600)
+
+    # The hour's maximum is the last live row, which the replay replaces
+    start = datetime(2026, 1, 1, 11, 59, 0)
+    writer.replace(*get_replay(start, datetime(2026, 1, 1, 11, 59, 59), 0.0))
+
+    hour = get_bucket("data_1_1h", datetime(2026, 1, 1, 11))
+    assert hour["count"] == 3600
+    assert (hour["signal_1_min"], hour["signal_1_max"]) == (0.0, 7139.0)
+
+
+def test_replace_refuses_trimmed_range(sqlite):
+    writer = sqlite.writer(1, COLUMNS, 300)
+    write_live(writer, 2 * 3600)
+
+    # The rows replaced in the 10:00 hour were trimmed, so their share of the
+    # bucket is unknown
+    with pytest.raises(ValueError):
+        writer.replace(
+            *get_replay(
+                datetime(2026, 1, 1, 10, 0, 30), datetime(2026, 1, 1, 10, 59, 30), 0.0
+            )
+        )
+
+    hour = get_bucket("data_1_1h", START)
+    assert (hour["count"], hour["signal_1_sum"]) == (3600, sum(range(3600)))
+    minute = get_bucket("data_1_1m", START)
+    assert minute["count"] == 60
+
+
+def rename(table, name):
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE {} RENAME TO {}".format(table, name)))
+
+
+def count_rows(table):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM {}".format(table))).scalar()
+
+
+def test_failed_flush_keeps_rows(sqlite):
+    writer = sqlite.writer(1, COLUMNS, 300, batch_size=4)
+
+    # The full batch cannot be written while the table is away
+    rename("data_1", "data_1_away")
+    for i in range(6):
+        writer.write(START + timedelta(seconds=i), np.array([float(i), 0.0]))
+    assert writer.failed
+    assert len(writer.rows) == 6
+    assert 0 < writer.timeout() <= writer.interval
+
+    rename("data_1_away", "data_1")
+    writer.flush()
+    assert not writer.failed
+    assert len(writer.rows) == 0
+    assert writer.timeout() is None
+    assert count_rows("data_1") == 6
+    assert get_bucket("data_1_1m", START)["count"] == 6
+
+
+def test_failed_flush_drops_expired_rows(sqlite):
+    writer = sqlite.writer(1, COLUMNS, 300, batch_size=2)
+
+    rename("data_1", "data_1_away")
+    writer.write(START, np.array([0.0, 0.0]))
+    writer.write(START + timedelta(seconds=400), np.array([1.0, 0.0]))
+    # The first row fell out of retention, the flush would trim it anyway
+    assert writer.failed
+    assert writer.times == [START + timedelta(seconds=400)]
+
+    rename("data_1_away", "data_1")
+    writer.flush()
+    assert count_rows("data_1") == 1
@@ -11,6 +11,7 @@
 import time
 import random
 import itertools
+from typing import Tuple
 
 import numpy as np
 import scipy as sp
@@ -103,6 +104,16 @@ class Repeater(nn.Module):
 
         return z
 
+    @torch.jit.export
+    def step(
+        self, x: torch.Tensor, y: torch.Tensor, h: torch.Tensor, c: torch.Tensor
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        output, (h_n, c_n) = self.lstm(torch.cat((x, y), dim=2), (h, c))
+
+        z = self.linear(output)
+
+        return z, h_n, c_n
+
     def train_loop(self, dataloader):
         train_loss = []
         period = []
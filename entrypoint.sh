@@ -1,9 +1,18 @@
 #!/usr/bin/env bash
 set -e
 
+if [ "${SENSOR_RUNNER:-embedded}" = "external" ]; then
+  # The image only ships compiled modules, so run it as one
+  (cd /app/api && exec python -m runner) &
+fi
+
+# Every open /stream holds one of these threads while connected; at most
+# SENSOR_STREAM_LIMIT (16) streams are accepted, the rest get a 503
 gunicorn \
   --chdir /app/api \
   --bind 0.0.0.0:5000 \
+  --worker-class gthread \
+  --threads ${GUNICORN_THREADS:-32} \
   run:app &
 
 exec nginx -g "daemon off;"
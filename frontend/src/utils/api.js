@@ -84,6 +84,10 @@ const _delete = async (endpoint = '') => {
     }
 }
 
+const stream = (endpoint = '') => {
+    return new EventSource(url + endpoint);
+}
+
 const auth = async (endpoint = '', data = {}) => {
     try {
         const response = await fetch(url + endpoint, {
@@ -102,4 +106,4 @@ const auth = async (endpoint = '', data = {}) => {
 }
 
 
-export default { get, post, put, _delete, auth };
\ No newline at end of file
+export default { get, post, put, _delete, stream, auth };
\ No newline at end of file